@@ -1,9 +1,15 @@
+import asyncio
+from typing import Optional
+
 import dateutil.parser
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.responses import StreamingResponse
 
 from api.app.api.dependencies.database import get_repository
 from api.app.db.repositories.companies import CompaniesRepository
+from api.app.db.search import InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from api.app.services.export import export_pages, EXPORT_MEDIA_TYPES
 
 router = APIRouter()
 
@@ -16,16 +22,7 @@ router = APIRouter()
 async def get_top_companies(
     companies_repo: CompaniesRepository = Depends(get_repository(CompaniesRepository)),
 ) -> dict:
-    companies = await companies_repo.get_top_companies()
-    buckets = []
-    for idx, company in enumerate(companies["aggregations"]["contracts"]["total"]["buckets"]):
-        company_info = await companies_repo.get_company_awardings(company["key"], limit=1)
-        if company_info["hits"]["hits"] and company_info["hits"]["hits"][0]:
-            bucket = companies["aggregations"]["contracts"]["total"]["buckets"][idx]
-            bucket["company"] = company_info["hits"]["hits"][0]["inner_hits"]["adjudicatario"]
-            buckets.append(bucket)
-    companies["aggregations"]["contracts"]["total"]["buckets"] = buckets
-    return companies
+    return await companies_repo.get_top_companies()
 
 
 @router.get(
@@ -37,27 +34,50 @@ async def get_company(
     company_id: str,
     companies_repo: CompaniesRepository = Depends(get_repository(CompaniesRepository)),
 ) -> dict:
+    # The queries are independent, so they are sent together
+    company, contracts, competitors = await asyncio.gather(
+        companies_repo.get_company(company_id),
+        companies_repo.get_company_contracts(company_id),
+        companies_repo.get_company_competitors(company_id),
+    )
+    # The contracts are cached, so the histogram is rendered from them without querying again
+    histogram = await companies_repo.get_company_histogram(company_id)
     return {
-        "company": await companies_repo.get_company(company_id),
-        "contracts": await companies_repo.get_company_contracts(company_id),
-        "competitors": {
-            "took": 0,
-            "timed_out": False,
-            "_shards": {
-                "total": 1,
-                "successful": 1,
-                "skipped": 0,
-                "failed": 0
-            },
-            "hits": {
-                "total": {
-                    "value": 0,
-                    "relation": "eq"
-                },
-                "max_score": 0,
-                "hits": []
-                }
-            },
+        "company": company,
+        "contracts": contracts,
+        "competitors": competitors,
         "candidacies": [],
-        "histogram": """<svg viewBox="0 0 250 200" preserveAspectRatio="none"></svg>"""
+        "histogram": histogram
         }
+
+
+@router.get(
+    '/{company_id}/contracts',
+    response_model=dict,
+    name="companies:get-company-contracts"
+)
+async def get_company_contracts(
+    company_id: str,
+    size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    companies_repo: CompaniesRepository = Depends(get_repository(CompaniesRepository)),
+) -> dict:
+    try:
+        return await companies_repo.get_company_contracts_page(company_id, size, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get(
+    '/{company_id}/export',
+    response_class=StreamingResponse,
+    name="companies:export-company-contracts"
+)
+async def export_company_contracts(
+    company_id: str,
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    companies_repo: CompaniesRepository = Depends(get_repository(CompaniesRepository)),
+) -> StreamingResponse:
+    pages = companies_repo.export_company_contracts(company_id)
+    return StreamingResponse(export_pages(pages, format), media_type=EXPORT_MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{company_id}.{format}"'})
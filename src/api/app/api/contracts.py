@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Depends
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from starlette.responses import StreamingResponse
 
 from api.app.api.dependencies.database import get_repository
 from api.app.db.repositories.contracts import ContractsRepository
+from api.app.services.export import export_pages, EXPORT_MEDIA_TYPES
 
 router = APIRouter()
 
@@ -27,6 +32,30 @@ async def count(
     return {"count": (await contracts_repo.count())["count"]}
 
 
+# Declared before /{contract_id}, so "export" is not taken for an id
+@router.get(
+    '/export',
+    response_class=StreamingResponse,
+    name="contracts:export"
+)
+async def export_contracts(
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    q: str = "",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    organo: Optional[List[str]] = Query(None),
+    tipo: Optional[List[str]] = Query(None),
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    contracts_repo: ContractsRepository = Depends(get_repository(ContractsRepository)),
+) -> StreamingResponse:
+    # Takes the same filters as the contract search and streams all the matches
+    pages = contracts_repo.export_contracts(q, date_from=date_from, date_to=date_to, organos=organo, tipos=tipo,
+                                            min_amount=min_amount, max_amount=max_amount)
+    return StreamingResponse(export_pages(pages, format), media_type=EXPORT_MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="contracts.{format}"'})
+
+
 @router.get(
     '/{contract_id}',
     response_model=dict,
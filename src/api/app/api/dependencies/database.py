@@ -4,6 +4,8 @@ from fastapi import Depends
 from starlette.requests import Request
 
 from elasticsearch import AsyncElasticsearch
+from ...db.batcher import SearchBatcher
+from ...db.cache import ResponseCache
 from ...db.repositories.base import BaseRepository
 
 
@@ -11,9 +13,20 @@ def _get_db_client(request: Request) -> AsyncElasticsearch:
     return request.app.state.db
 
 
+def get_cache(request: Request) -> ResponseCache:
+    return request.app.state.cache
+
+
+def get_batcher(client: AsyncElasticsearch = Depends(_get_db_client)) -> SearchBatcher:
+    # Dependencies are solved once per request, so all the repositories of a request share the batcher
+    return SearchBatcher(client)
+
+
 def get_repository(repo_type: Type[BaseRepository]) -> Callable:  # type: ignore
     async def _get_repo(
         client: AsyncElasticsearch = Depends(_get_db_client),
+        cache: ResponseCache = Depends(get_cache),
+        batcher: SearchBatcher = Depends(get_batcher),
     ) -> AsyncGenerator[BaseRepository, None]:
-        yield repo_type(client)
+        yield repo_type(client, cache, batcher)
     return _get_repo
@@ -1,10 +1,15 @@
-from typing import List
+import asyncio
+from datetime import date
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 
-from api.app.api.dependencies.database import get_repository
+from api.app.api.dependencies.database import get_cache, get_repository
+from api.app.db.cache import ResponseCache
 from api.app.db.repositories.companies import CompaniesRepository
 from api.app.db.repositories.contracts import ContractsRepository
+from api.app.db.repositories.suggestions import SuggestionsRepository, SUGGESTION_TYPES
+from api.app.db.search import get_page, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter()
 
@@ -20,12 +25,85 @@ async def search(
     contracts_repo: ContractsRepository = Depends(get_repository(ContractsRepository)),
 ) -> List[dict]:
     result = []
-    companies = await companies_repo.search_company(q)
+    # Both repositories share the batcher of the request, so the two searches are sent in a single _msearch
+    companies, contracts = await asyncio.gather(companies_repo.search_company(q), contracts_repo.search_contracts(q))
     for company in companies["hits"]["hits"]:
         company["type"] = "company"
         result.append({"hit": company})
-    contracts = await contracts_repo.search_contracts(q)
     for contract in contracts["hits"]["hits"]:
         contract["type"] = "contract"
         result.append({"hit": contract})
     return result
+
+
+@router.get(
+    '/search/companies',
+    response_model=dict,
+    name="main:search-companies"
+)
+async def search_companies(
+    q: str,
+    size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    companies_repo: CompaniesRepository = Depends(get_repository(CompaniesRepository)),
+) -> dict:
+    try:
+        return get_page(await companies_repo.search_company(q, size, cursor), size)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get(
+    '/search/contracts',
+    response_model=dict,
+    name="main:search-contracts"
+)
+async def search_contracts(
+    q: str = "",
+    size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    organo: Optional[List[str]] = Query(None),
+    tipo: Optional[List[str]] = Query(None),
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    facets: bool = False,
+    contracts_repo: ContractsRepository = Depends(get_repository(ContractsRepository)),
+) -> dict:
+    # The next page is requested with the cursor of the previous one and the same parameters
+    try:
+        response = await contracts_repo.search_contracts(q, size, cursor, date_from=date_from, date_to=date_to,
+                                                         organos=organo, tipos=tipo, min_amount=min_amount,
+                                                         max_amount=max_amount, facets=facets)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return get_page(response, size)
+
+
+@router.get(
+    '/suggest',
+    response_model=List[dict],
+    name="main:suggest"
+)
+async def suggest(
+    q: str = Query(..., min_length=1, max_length=100),
+    size: int = Query(10, ge=1, le=50),
+    type: Optional[List[str]] = Query(None),
+    suggestions_repo: SuggestionsRepository = Depends(get_repository(SuggestionsRepository)),
+) -> List[dict]:
+    if not q.strip():
+        raise HTTPException(status_code=422, detail="Empty query")
+    types = tuple(sorted(set(type) & set(SUGGESTION_TYPES))) if type else None
+    return await suggestions_repo.suggest(q.strip(), size, types)
+
+
+@router.get(
+    '/cache/stats',
+    response_model=dict,
+    name="main:cache-stats"
+)
+async def get_cache_stats(
+    cache: ResponseCache = Depends(get_cache),
+) -> dict:
+    return cache.stats()
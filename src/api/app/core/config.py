@@ -20,8 +20,20 @@ ALLOWED_HOSTS: List[str] = config(
 # Database configuration
 DATABASE_HOST: str = config("DATABASE_HOST", default="localhost")
 DATABASE_PORT: str = config("DATABASE_HOST", default="9200")
-COMPANIES_INDEX_NAME: str = "companies"
-CONTRACTS_INDEX_NAME: str = "contracts"
+# Aliases that point to the current generation of each index
+COMPANIES_INDEX_NAME: str = config("COMPANIES_INDEX_NAME", default="companies")
+CONTRACTS_INDEX_NAME: str = config("CONTRACTS_INDEX_NAME", default="contracts")
+COMPANY_STATS_INDEX_NAME: str = config("COMPANY_STATS_INDEX_NAME", default="company_stats")
+SUGGESTIONS_INDEX_NAME: str = config("SUGGESTIONS_INDEX_NAME", default="suggestions")
+META_INDEX_NAME: str = config("META_INDEX_NAME", default="etl-meta")
+GENERATION_DOC_ID: str = "generation"
+
+# Cache configuration
+CACHE_MAX_ENTRIES: int = config("CACHE_MAX_ENTRIES", cast=int, default=1024)
+CACHE_GENERATION_CHECK_INTERVAL: float = config("CACHE_GENERATION_CHECK_INTERVAL", cast=float, default=30)
+
+# Number of slices of the index scrolled in parallel by an export
+EXPORT_SLICES: int = config("EXPORT_SLICES", cast=int, default=4)
 
 # logging configuration
 LOGGING_LEVEL = logging.DEBUG if DEBUG else logging.INFO
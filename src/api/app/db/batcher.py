@@ -0,0 +1,62 @@
+import asyncio
+from typing import List, Optional, Set, Tuple
+
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.exceptions import HTTP_EXCEPTIONS, TransportError
+
+
+# Collects the searches issued while handling a request and sends the ones that are waiting at the same time in a
+# single _msearch. The batch is sent after two iterations of the event loop, so the tasks that are ready to run and
+# the ones they start (e.g. with asyncio.gather) can add their searches before it leaves.
+class SearchBatcher:
+    def __init__(self, client: AsyncElasticsearch) -> None:
+        self.client = client
+        self._queue: List[Tuple[str, dict, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+        # The event loop only keeps weak references to tasks, so the batches being sent are kept here
+        self._sending: Set[asyncio.Future] = set()
+
+    async def search(self, index: str, body: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((index, body, future))
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_soon(self._schedule_flush)
+        return await future
+
+    def _schedule_flush(self) -> None:
+        self._flush_handle = asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        queue, self._queue = self._queue, []
+        task = asyncio.ensure_future(self._send(queue))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, queue: list) -> None:
+        try:
+            if len(queue) == 1:
+                index, body, future = queue[0]
+                responses = [await self.client.search(index=index, body=body)]
+            else:
+                lines: list = []
+                for index, body, _ in queue:
+                    lines += [{"index": index}, body]
+                responses = (await self.client.msearch(body=lines))["responses"]
+        except Exception as e:
+            for _, _, future in queue:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), response in zip(queue, responses):
+            if future.done():
+                continue
+            if "error" in response:
+                # Every search fails on its own, with the exception the search API would have raised
+                status = response.get("status", 500)
+                error = response["error"]
+                error_type = error.get("type") if isinstance(error, dict) else str(error)
+                future.set_exception(HTTP_EXCEPTIONS.get(status, TransportError)(status, error_type, response))
+            else:
+                future.set_result(response)
@@ -0,0 +1,121 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from elasticsearch import AsyncElasticsearch
+
+from ..core.config import META_INDEX_NAME, GENERATION_DOC_ID
+
+
+# LRU cache of repository responses with a TTL per entry. Entries are dropped when the ETL bumps the data generation
+# stored in the meta index. Concurrent misses of the same key wait for a single query. Cached responses are shared
+# between requests, so they must not be modified.
+class ResponseCache:
+    def __init__(self, max_entries: int, generation_check_interval: float) -> None:
+        self.max_entries = max_entries
+        self.generation_check_interval = generation_check_interval
+        self.generation: Optional[str] = None
+        self._entries: OrderedDict = OrderedDict()
+        self._pending: dict = {}
+        self._next_generation_check = 0.0
+        self._generation_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    async def get_or_load(self, client: AsyncElasticsearch, key: tuple, ttl: float, load: Callable) -> Any:
+        await self._check_generation(client)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.expirations += 1
+        if key in self._pending:
+            self.coalesced += 1
+            return await asyncio.shield(self._pending[key])
+        self.misses += 1
+        # The query runs in a task owned by the cache, so a request that is cancelled (e.g. when its client
+        # disconnects) does not cancel it for the other requests waiting for it
+        task = asyncio.ensure_future(self._load(key, ttl, load))
+        task.add_done_callback(_retrieve_exception)
+        self._pending[key] = task
+        return await asyncio.shield(task)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "generation": self.generation,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    async def _load(self, key: tuple, ttl: float, load: Callable) -> Any:
+        generation = self.generation
+        try:
+            value = await load()
+        finally:
+            del self._pending[key]
+        if generation == self.generation:
+            self._put(key, value, ttl)
+        return value
+
+    def _put(self, key: tuple, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _check_generation(self, client: AsyncElasticsearch) -> None:
+        # The marker is read at most once per interval, by a single request
+        if time.monotonic() < self._next_generation_check:
+            return
+        async with self._generation_lock:
+            if time.monotonic() < self._next_generation_check:
+                return
+            response = await client.get(index=META_INDEX_NAME, id=GENERATION_DOC_ID, ignore=404)
+            generation = response.get("_source", {}).get("generation") if response.get("found") else None
+            if generation != self.generation:
+                if self._entries:
+                    self.invalidations += 1
+                self.clear()
+                self.generation = generation
+            self._next_generation_check = time.monotonic() + self.generation_check_interval
+
+
+def _retrieve_exception(task: asyncio.Future) -> None:
+    # The requests waiting for a query may all have been cancelled, so its exception is marked as retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+# Caches the response of a repository method for ttl seconds, keyed on its name and arguments
+def cached(ttl: float) -> Callable:
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):  # type: ignore
+            if self.cache is None:
+                return await method(self, *args, **kwargs)
+            key = (type(self).__name__, method.__name__, args, tuple(sorted(kwargs.items())))
+            return await self.cache.get_or_load(self.client, key, ttl, lambda: method(self, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -2,12 +2,14 @@ from fastapi import FastAPI
 from elasticsearch import AsyncElasticsearch
 from loguru import logger
 
-from ..core.config import DATABASE_HOST, DATABASE_PORT
+from .cache import ResponseCache
+from ..core.config import DATABASE_HOST, DATABASE_PORT, CACHE_MAX_ENTRIES, CACHE_GENERATION_CHECK_INTERVAL
 
 
 async def connect_to_db(app: FastAPI) -> None:
     logger.info(f"Connecting to {DATABASE_HOST}:{DATABASE_PORT}")
     app.state.db = AsyncElasticsearch([{'host': DATABASE_HOST, 'port': DATABASE_PORT}])
+    app.state.cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_GENERATION_CHECK_INTERVAL)
     logger.debug(await app.state.db.info())
     logger.info("Connection established")
 
@@ -1,10 +1,28 @@
+from typing import Optional
+
 from elasticsearch import AsyncElasticsearch
 
+from ..batcher import SearchBatcher
+from ..cache import ResponseCache
+
 
 class BaseRepository:
-    def __init__(self, client: AsyncElasticsearch) -> None:
+    def __init__(self, client: AsyncElasticsearch, cache: Optional[ResponseCache] = None,
+                 batcher: Optional[SearchBatcher] = None) -> None:
         self._client = client
+        self._cache = cache
+        self._batcher = batcher
 
     @property
     def client(self) -> AsyncElasticsearch:
         return self._client
+
+    @property
+    def cache(self) -> Optional[ResponseCache]:
+        return self._cache
+
+    async def search(self, index: str, body: dict) -> dict:
+        # Searches go through the batcher of the request, if any, so concurrent ones are sent in a single _msearch
+        if self._batcher is None:
+            return await self._client.search(index=index, body=body)
+        return await self._batcher.search(index, body)
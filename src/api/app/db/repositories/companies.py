@@ -1,11 +1,21 @@
-from ...core.config import COMPANIES_INDEX_NAME, CONTRACTS_INDEX_NAME
+import asyncio
+from datetime import datetime, timezone
+from typing import AsyncIterator
+
+from ...core.config import COMPANIES_INDEX_NAME, COMPANY_STATS_INDEX_NAME, CONTRACTS_INDEX_NAME, EXPORT_SLICES
+from ...db.cache import cached
 from ...db.repositories.base import BaseRepository
+from ...db.scroll import sliced_scroll
+from ...db.search import (get_company_contracts_query, get_company_contracts_search, get_company_search, get_page,
+                          DEFAULT_PAGE_SIZE)
+from ...services.histogram import render_histogram
 
 
 class CompaniesRepository(BaseRepository):
 
+    @cached(ttl=3600)
     async def get_company(self, company_id: str) -> dict:
-        return await self.client.search(index=COMPANIES_INDEX_NAME, body={
+        return await self.search(index=COMPANIES_INDEX_NAME, body={
             "query": {
                 "terms": {
                     "_id": [company_id]
@@ -34,10 +44,39 @@ class CompaniesRepository(BaseRepository):
         if limit is not None:
             body["from"] = 0
             body["size"] = limit
-        return await self.client.search(index=CONTRACTS_INDEX_NAME, body=body)
+        return await self.search(index=CONTRACTS_INDEX_NAME, body=body)
+
+    @cached(ttl=3600)
+    async def get_company_stats(self, company_id: str) -> dict:
+        # Statistics computed by the ETL, empty if the company has no contracts
+        stats = await self.client.get(index=COMPANY_STATS_INDEX_NAME, id=company_id, ignore=404)
+        return stats["_source"] if stats.get("found") else {}
+
+    @cached(ttl=3600)
+    async def get_company_competitors(self, company_id: str) -> dict:
+        # The competitors computed by the ETL, returned as a search of their companies sorted by score
+        competitors = (await self.get_company_stats(company_id)).get("competitors", [])
+        return {
+            "took": 0,
+            "timed_out": False,
+            "hits": {
+                "total": {"value": len(competitors), "relation": "eq"},
+                "max_score": competitors[0]["score"] if competitors else None,
+                "hits": [{
+                    "_index": COMPANIES_INDEX_NAME,
+                    "_id": competitor["id"],
+                    "_score": competitor["score"],
+                    "_source": {"name": competitor["nombre"], "nif": competitor["nif"], "id": competitor["id"],
+                                "shared_groups": competitor["shared_groups"]},
+                } for competitor in competitors]
+            }
+        }
 
+    @cached(ttl=3600)
     async def get_company_contracts(self, company_id: str) -> dict:
-        return await self.client.search(index=CONTRACTS_INDEX_NAME, body={
+        # The histogram and the total are read from the statistics computed by the ETL, and returned in the shape of
+        # the aggregations that computed them on every request
+        contracts, stats = await asyncio.gather(self.search(index=CONTRACTS_INDEX_NAME, body={
             "query": {
                 "nested": {
                         "path": "adjudicatario",
@@ -49,67 +88,98 @@ class CompaniesRepository(BaseRepository):
                             }
                         }
                 }
-            },
-            "aggs": {
-                "histogram": {
-                    "date_histogram": {
-                        "field": "fecha-formalizacion",
-                        "calendar_interval": "month"
-                    }
-                },
-                "contracts": {
-                    "nested": {
-                        "path": "adjudicatario"
-                    },
-                    "aggs": {
-                        "total": {"sum": {"field": "adjudicatario.vat_included"}}
-                    }
-                }
             }
-        })
+        }), self.get_company_stats(company_id))
+        contracts["aggregations"] = {
+            "histogram": {"buckets": _get_histogram_buckets(stats.get("monthly", []))},
+            "contracts": {
+                "doc_count": stats.get("contract_count", 0),
+                "total": {"value": stats.get("total_vat_included", 0.0)},
+            },
+        }
+        return contracts
+
+    async def get_company_contracts_page(self, company_id: str, size=DEFAULT_PAGE_SIZE, cursor=None) -> dict:
+        # Each page starts after the last contract of the previous one, whose sort values are the cursor. The sort
+        # ends with the reference and the file number, so no contract is skipped or repeated between pages. The
+        # totals and the histogram are in get_company_contracts.
+        body = get_company_contracts_search(company_id, size, cursor)
+        return get_page(await self.search(index=CONTRACTS_INDEX_NAME, body=body), size)
 
-    async def search_company(self, query: str) -> dict:
-        return await self.client.search(index=COMPANIES_INDEX_NAME, body={
+    def export_company_contracts(self, company_id: str, slices=EXPORT_SLICES) -> AsyncIterator[list]:
+        return sliced_scroll(self.client, CONTRACTS_INDEX_NAME, get_company_contracts_query(company_id), slices)
+
+    @cached(ttl=3600)
+    async def get_company_histogram(self, company_id: str) -> str:
+        # Rendered once per company until the data generation changes
+        contracts = await self.get_company_contracts(company_id)
+        return render_histogram(contracts["aggregations"]["histogram"]["buckets"])
+
+    async def search_company(self, query: str, size=DEFAULT_PAGE_SIZE, cursor=None) -> dict:
+        return await self.search(index=COMPANIES_INDEX_NAME, body=get_company_search(query, size, cursor))
+
+    @cached(ttl=3600)
+    async def get_top_companies(self) -> dict:
+        companies = await self.search(index=COMPANY_STATS_INDEX_NAME, body={
+            "size": 1000,
+            "_source": ["nombre", "nif", "contract_count", "total_vat_included"],
             "query": {
-                "query_string": {
-                    "query": query,
-                    "analyze_wildcard": True,
-                    "default_field": "*"
+                "bool": {
+                    "must_not": [{"term": {"nombre.keyword": ""}}]
                 }
-            }
+            },
+            "sort": [
+                {"total_vat_included": {"order": "desc"}}
+            ]
         })
-
-    async def get_top_companies(self) -> dict:
-        return await self.client.search(index=CONTRACTS_INDEX_NAME, body={
-            "size": 0,
-            "aggs": {
-                "contracts": {
-                    "nested": {
-                        "path": "adjudicatario"
-                    },
-                    "aggs": {
-                        "total": {
-                            "terms": {
-                                "field": "adjudicatario.name.keyword",
-                                "exclude": "",
-                                "size": 1000,
-                            },
-                            "aggs": {
-                                "euros": {
-                                    "sum": {
-                                        "field": "adjudicatario.vat_included"
-                                    },
-                                },
-                                "euros_bucket_sort": {
-                                    "bucket_sort": {
-                                        "sort": [
-                                            {"euros": {"order": "desc"}}
-                                        ]
-                                    }
-                                }
-                            }
-                        }
-                    }
+        # Every company is returned as a bucket of the terms aggregation that computed the totals on every request
+        hits = companies.pop("hits")["hits"]
+        companies["aggregations"] = {
+            "contracts": {
+                "doc_count": sum(hit["_source"]["contract_count"] for hit in hits),
+                "total": {
+                    "doc_count_error_upper_bound": 0,
+                    "sum_other_doc_count": 0,
+                    "buckets": [_get_company_bucket(hit) for hit in hits],
                 }
             }
+        }
+        return companies
+
+
+def _get_company_bucket(hit: dict) -> dict:
+    stats = hit["_source"]
+    return {
+        "key": stats["nombre"],
+        "doc_count": stats["contract_count"],
+        "euros": {"value": stats["total_vat_included"]},
+        "company": {
+            "hits": {
+                "total": {"value": 1, "relation": "eq"},
+                "max_score": None,
+                "hits": [{
+                    "_id": hit["_id"],
+                    "_source": {"name": stats["nombre"], "nif": stats["nif"], "id": hit["_id"]},
+                }]
+            }
+        }
+    }
+
+
+def _get_histogram_buckets(monthly: list) -> list:
+    # A bucket per month from the first to the last contract, including the months without contracts
+    counts = {month["month"]: month["contracts"] for month in monthly}
+    if not counts:
+        return []
+    year, month = map(int, min(counts).split("-"))
+    last = max(counts)
+    buckets = []
+    while f"{year:04d}-{month:02d}" <= last:
+        date = datetime(year, month, 1, tzinfo=timezone.utc)
+        buckets.append({
+            "key_as_string": date.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "key": int(date.timestamp() * 1000),
+            "doc_count": counts.get(f"{year:04d}-{month:02d}", 0),
         })
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return buckets
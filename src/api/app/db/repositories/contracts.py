@@ -1,25 +1,27 @@
-from ...core.config import CONTRACTS_INDEX_NAME
+from typing import AsyncIterator
+
+from ...core.config import CONTRACTS_INDEX_NAME, EXPORT_SLICES
+from ...db.cache import cached
 from ...db.repositories.base import BaseRepository
+from ...db.scroll import sliced_scroll
+from ...db.search import get_contract_query, get_contract_search, DEFAULT_PAGE_SIZE
 
 
 class ContractsRepository(BaseRepository):
 
-    async def search_contracts(self, query: str) -> dict:
-        return await self.client.search(index=CONTRACTS_INDEX_NAME, body={
-            "query": {
-                "query_string": {
-                  "query": query,
-                  "analyze_wildcard": True,
-                  "default_field": "*"
-                }
-            }
-        })
+    async def search_contracts(self, query: str, size=DEFAULT_PAGE_SIZE, cursor=None, **filters) -> dict:
+        return await self.search(index=CONTRACTS_INDEX_NAME, body=get_contract_search(query, size, cursor, **filters))
+
+    def export_contracts(self, query: str, slices=EXPORT_SLICES, **filters) -> AsyncIterator[list]:
+        return sliced_scroll(self.client, CONTRACTS_INDEX_NAME, get_contract_query(query, **filters), slices)
 
+    @cached(ttl=300)
     async def count(self) -> dict:
         return await self.client.count(index=CONTRACTS_INDEX_NAME, human=True)
 
+    @cached(ttl=3600)
     async def get_contract(self, contract_id):
-        return await self.client.search(index=CONTRACTS_INDEX_NAME, body={
+        return await self.search(index=CONTRACTS_INDEX_NAME, body={
             "query": {
                 "terms": {
                     "_id": [contract_id]
@@ -27,8 +29,9 @@ class ContractsRepository(BaseRepository):
             }
         })
 
+    @cached(ttl=300)
     async def get_latest_contracts(self):
-        return await self.client.search(index=CONTRACTS_INDEX_NAME, body={
+        return await self.search(index=CONTRACTS_INDEX_NAME, body={
           "query": {
             "match_all": {}
           },
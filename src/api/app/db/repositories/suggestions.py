@@ -0,0 +1,32 @@
+from typing import Optional, Tuple
+
+from ...core.config import SUGGESTIONS_INDEX_NAME
+from ...db.repositories.base import BaseRepository
+
+SUGGESTION_TYPES = ("company", "organo", "contract")
+
+
+class SuggestionsRepository(BaseRepository):
+
+    async def suggest(self, prefix: str, size: int = 10, types: Optional[Tuple[str, ...]] = None) -> list:
+        # Completion suggestions are looked up in memory by prefix, sorted by the amount awarded. The type context is
+        # always given, so all the types are requested when none is. They are not cached, as every prefix typed would
+        # push the costly responses out of the cache. Suggestions with the same text (e.g. different companies with
+        # the same name) are all returned.
+        response = await self.search(index=SUGGESTIONS_INDEX_NAME, body={
+            "_source": ["type", "id", "text", "nif", "total_vat_included"],
+            "suggest": {
+                "suggestions": {
+                    "prefix": prefix,
+                    "completion": {
+                        "field": "suggest",
+                        "size": size,
+                        "contexts": {
+                            "type": list(types or SUGGESTION_TYPES)
+                        }
+                    }
+                }
+            }
+        })
+        return [dict(option["_source"], input=option["text"])
+                for option in response["suggest"]["suggestions"][0]["options"]]
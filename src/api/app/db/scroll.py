@@ -0,0 +1,58 @@
+import asyncio
+from typing import AsyncIterator
+
+from elasticsearch import AsyncElasticsearch
+
+# Constants
+SCROLL_KEEP_ALIVE = "2m"
+SCROLL_PAGE_SIZE = 1000
+DONE = None
+
+
+async def sliced_scroll(client: AsyncElasticsearch, index: str, query: dict, slices: int,
+                        size=SCROLL_PAGE_SIZE) -> AsyncIterator[list]:
+    # Yields the pages of hits of the query, in no particular order. Every slice of the index is scrolled by its own
+    # task and the pages go through a queue with room for a page per slice, so the slices wait while the pages are
+    # consumed and the memory does not grow with the number of hits.
+    queue: asyncio.Queue = asyncio.Queue(maxsize=slices)
+
+    async def scroll_slice(slice_id: int) -> None:
+        body = {"query": query, "sort": ["_doc"]}
+        if slices > 1:
+            body["slice"] = {"id": slice_id, "max": slices}
+        scroll_id = None
+        try:
+            response = await client.search(index=index, body=body, size=size, scroll=SCROLL_KEEP_ALIVE)
+            scroll_id = response.get("_scroll_id")
+            while response["hits"]["hits"]:
+                await queue.put(response["hits"]["hits"])
+                response = await client.scroll(scroll_id=scroll_id, scroll=SCROLL_KEEP_ALIVE)
+                scroll_id = response.get("_scroll_id")
+            await queue.put(DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            if scroll_id is not None:
+                try:
+                    await client.clear_scroll(scroll_id=scroll_id, ignore=404)
+                except Exception:
+                    pass
+
+    tasks = [asyncio.ensure_future(scroll_slice(slice_id)) for slice_id in range(slices)]
+    remaining = slices
+    try:
+        while remaining:
+            page = await queue.get()
+            if page is DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        # The slices still running are stopped if the export fails or the client goes away
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,174 @@
+import base64
+import binascii
+import json
+import re
+from datetime import date
+from typing import List, Optional
+
+# Constants
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+FACET_SIZE = 10
+# Words, or phrases between quotes, optionally excluded with a leading -
+TERM_REGEX = re.compile(r'-?"[^"]*"|\S+')
+# Only these fields are searched, with the weight of each one
+COMPANY_SEARCH_FIELDS = ["nombre^3", "aliases^2", "nif^5"]
+CONTRACT_SEARCH_FIELDS = ["titulo^3", "objeto-contrato^2", "organo.text", "suborgano.text", "referencia^5",
+                          "numero-expediente^5"]
+AWARDEE_SEARCH_FIELDS = ["adjudicatario.name^2", "adjudicatario.nif^5"]
+# The score is tied by fields with a value per document, so search_after resumes exactly where the page ended
+COMPANY_SORT = [{"_score": "desc"}, {"nif": "asc"}]
+CONTRACT_SORT = [{"_score": "desc"}, {"fecha-formalizacion": {"order": "desc", "missing": "_last"}},
+                 {"referencia": "asc"}, {"numero-expediente": "asc"}]
+COMPANY_CONTRACT_SORT = [{"fecha-formalizacion": {"order": "desc", "missing": "_last"}}, {"referencia": "asc"},
+                         {"numero-expediente": "asc"}]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: list) -> list:
+    # A cursor holds a value per field of the sort, otherwise Elasticsearch rejects the search
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    if (not isinstance(values, list) or len(values) != len(sort) or
+            any(isinstance(value, (list, dict)) for value in values)):
+        raise InvalidCursor(cursor)
+    return values
+
+
+def get_company_search(query: str, size=DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> dict:
+    body = {
+        "size": size,
+        "query": _get_text_query(query, COMPANY_SEARCH_FIELDS),
+        "sort": COMPANY_SORT,
+    }
+    if cursor:
+        body["search_after"] = decode_cursor(cursor, COMPANY_SORT)
+    return body
+
+
+def get_contract_query(query: str, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                       organos: Optional[List[str]] = None, tipos: Optional[List[str]] = None,
+                       min_amount: Optional[float] = None, max_amount: Optional[float] = None) -> dict:
+    # The filters do not affect the score, so they run in filter context and Elasticsearch caches them
+    filters: list = []
+    if date_from or date_to:
+        filters.append({"range": {"fecha-formalizacion": _get_range(date_from and date_from.isoformat(),
+                                                                     date_to and date_to.isoformat())}})
+    if organos:
+        filters.append({"terms": {"organo": organos}})
+    if tipos:
+        filters.append({"terms": {"tipo": tipos}})
+    if min_amount is not None or max_amount is not None:
+        filters.append({"range": {"importe-con-iva": _get_range(min_amount, max_amount)}})
+    text_query = {"match_all": {}}
+    # Terms without any word (e.g. the operators of simple_query_string) match nothing by themselves
+    terms = [term for term in TERM_REGEX.findall(query or "") if re.search(r"\w", term)]
+    if terms:
+        # The awardees are nested, so they are searched with their own query. Every term has to match the fields of
+        # the contract or the ones of an awardee, so a search can mix both (e.g. "limpieza Ferrovial"), and an
+        # excluded term (e.g. "-obras") can match neither
+        text_query = {"bool": {
+            "must": [_get_contract_term_query(term) for term in terms if not term.startswith("-")],
+            "must_not": [_get_contract_term_query(term[1:]) for term in terms if term.startswith("-")],
+        }}
+    return {"bool": {"must": [text_query], "filter": filters}}
+
+
+def get_contract_search(query: str, size=DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, facets=False,
+                        **filters) -> dict:
+    body = {
+        "size": size,
+        "query": get_contract_query(query, **filters),
+        "sort": CONTRACT_SORT,
+    }
+    if cursor:
+        body["search_after"] = decode_cursor(cursor, CONTRACT_SORT)
+    elif facets:
+        # The facets count the matches of the whole search, so they are only computed for the first page
+        body["aggs"] = {
+            "organo": {"terms": {"field": "organo", "size": FACET_SIZE}},
+            "tipo": {"terms": {"field": "tipo", "size": FACET_SIZE}},
+            "year": {"date_histogram": {"field": "fecha-formalizacion", "calendar_interval": "year",
+                                        "format": "yyyy", "min_doc_count": 1}},
+        }
+    return body
+
+
+def get_company_contracts_query(company_id: str) -> dict:
+    return {
+        "nested": {
+            "path": "adjudicatario",
+            "query": {"term": {"adjudicatario.id": company_id}}
+        }
+    }
+
+
+def get_company_contracts_search(company_id: str, size=DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> dict:
+    body = {
+        "size": size,
+        "query": get_company_contracts_query(company_id),
+        "sort": COMPANY_CONTRACT_SORT,
+        # The total is only counted for the first page
+        "track_total_hits": not cursor,
+    }
+    if cursor:
+        body["search_after"] = decode_cursor(cursor, COMPANY_CONTRACT_SORT)
+    return body
+
+
+def get_page(response: dict, size: int) -> dict:
+    # A full page has a cursor to the next one, made of the sort values of its last hit
+    hits = response["hits"]["hits"]
+    page = {
+        "total": response["hits"].get("total"),
+        "hits": hits,
+        "next": encode_cursor(hits[-1]["sort"]) if len(hits) == size else None,
+    }
+    if "aggregations" in response:
+        page["facets"] = {name: [{"key": bucket.get("key_as_string", bucket["key"]), "count": bucket["doc_count"]}
+                                 for bucket in aggregation["buckets"]]
+                          for name, aggregation in response["aggregations"].items()}
+    return page
+
+
+def _get_contract_term_query(term: str) -> dict:
+    return {
+        "bool": {
+            "should": [
+                _get_text_query(term, CONTRACT_SEARCH_FIELDS),
+                {
+                    "nested": {
+                        "path": "adjudicatario",
+                        "score_mode": "max",
+                        "query": _get_text_query(term, AWARDEE_SEARCH_FIELDS)
+                    }
+                }
+            ],
+            "minimum_should_match": 1
+        }
+    }
+
+
+def _get_text_query(query: str, fields: list) -> dict:
+    # The syntax of simple_query_string never fails on user input, and all the words have to match
+    return {
+        "simple_query_string": {
+            "query": query,
+            "fields": fields,
+            "default_operator": "and",
+            "lenient": True
+        }
+    }
+
+
+def _get_range(gte, lte) -> dict:
+    return {key: value for key, value in (("gte", gte), ("lte", lte)) if value is not None}
@@ -0,0 +1,39 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterable
+
+# Constants
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+CSV_COLUMNS = ["referencia", "numero-expediente", "titulo", "objeto-contrato", "organo", "suborgano", "tipo",
+               "procedimiento", "codigo-cpv", "fecha-formalizacion", "importe-sin-iva", "importe-con-iva", "url"]
+AWARDEE_SEPARATOR = " | "
+
+
+# Contracts are exported a page at a time, so the pages can be streamed as they are read
+def format_ndjson(hits: Iterable[dict]) -> str:
+    return "".join(json.dumps(dict(hit["_source"], id=hit["_id"]), ensure_ascii=False) + "\n" for hit in hits)
+
+
+def format_csv(hits: Iterable[dict], header=False) -> str:
+    # The awardees of a contract are joined in a single column as "name (NIF)"
+    output = io.StringIO()
+    writer = csv.writer(output)
+    if header:
+        writer.writerow(["id", *CSV_COLUMNS, "adjudicatarios"])
+    for hit in hits:
+        contract = hit["_source"]
+        awardees = AWARDEE_SEPARATOR.join(f"{awardee.get('name')} ({awardee.get('nif')})"
+                                          for awardee in contract.get("adjudicatario") or [])
+        writer.writerow([hit["_id"], *(contract.get(column) for column in CSV_COLUMNS), awardees])
+    return output.getvalue()
+
+
+async def export_pages(pages: AsyncIterator[list], format: str) -> AsyncIterator[str]:
+    if format == "csv":
+        yield format_csv([], header=True)
+    async for page in pages:
+        yield format_csv(page) if format == "csv" else format_ndjson(page)
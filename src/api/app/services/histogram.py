@@ -0,0 +1,22 @@
+import numpy as np
+
+# Constants
+WIDTH = 250
+HEIGHT = 200
+PRECISION = 2
+
+
+# Renders the buckets of a date histogram as a sparkline of bars that fills the whole chart: the tallest bar is as
+# high as the chart and the chart is stretched to the size of its container
+def render_histogram(buckets: list) -> str:
+    counts = np.array([bucket["doc_count"] for bucket in buckets], dtype=float)
+    paths = []
+    if counts.size and counts.max() > 0:
+        bar_width = WIDTH / counts.size
+        xs = np.round(np.arange(counts.size) * bar_width, PRECISION)
+        heights = np.round(counts / counts.max() * HEIGHT, PRECISION)
+        bar_width = round(bar_width, PRECISION)
+        # A single path with a closed rectangle per non-empty month
+        paths = [f"M{x:g} {HEIGHT}v-{h:g}h{bar_width:g}v{h:g}z" for x, h in zip(xs, heights) if h > 0]
+    path = f'<path d="{"".join(paths)}"/>' if paths else ""
+    return f'<svg viewBox="0 0 {WIDTH} {HEIGHT}" preserveAspectRatio="none">{path}</svg>'
@@ -1,21 +1,54 @@
 import argparse
+import sys
+from contextlib import nullcontext
+from datetime import datetime
 
 from elasticsearch import Elasticsearch
-from elastic import search
+from elastic import export, search
+from app.core.config import COMPANIES_INDEX_NAME, CONTRACTS_INDEX_NAME, EXPORT_SLICES
+from app.db.search import get_company_contracts_query, get_contract_query
+from app.services.export import format_csv, format_ndjson, EXPORT_MEDIA_TYPES
 
 
 def main():
     parser = argparse.ArgumentParser(description='CLI to load data to Elasticsearch')
-    parser.add_argument('endpoint', choices=['search'])
-    parser.add_argument('argument')
+    parser.add_argument('endpoint', choices=['search', 'export'])
+    parser.add_argument('argument', nargs='?', default='', help="Query of the search or of the exported contracts")
+    parser.add_argument('--company-id', help="Exports the contracts of a company instead of the query")
+    parser.add_argument('--format', choices=list(EXPORT_MEDIA_TYPES), default='ndjson', help="Format of the export")
+    parser.add_argument('--output', help="File the export is written to. Standard output if not set")
+    parser.add_argument('--slices', type=int, default=EXPORT_SLICES,
+                        help="Number of slices of the index exported in parallel")
+    parser.add_argument('--date-from', type=valid_date, help="Start date of the exported contracts (Format %%Y-%%m-%%d)")
+    parser.add_argument('--date-to', type=valid_date, help="End date of the exported contracts (Format %%Y-%%m-%%d)")
+    parser.add_argument('--organo', action='append', dest='organos', help="Organ of the exported contracts")
+    parser.add_argument('--tipo', action='append', dest='tipos', help="Type of the exported contracts")
+    parser.add_argument('--min-amount', type=float, help="Minimum amount (VAT included) of the exported contracts")
+    parser.add_argument('--max-amount', type=float, help="Maximum amount (VAT included) of the exported contracts")
     controller(**vars(parser.parse_args()))
 
 
-def controller(endpoint: str, argument: str):
+def valid_date(s: str):
+    try:
+        return datetime.strptime(s, "%Y-%m-%d").date()
+    except ValueError:
+        msg = "Not a valid date: '{0}'.".format(s)
+        raise argparse.ArgumentTypeError(msg)
+
+
+def controller(endpoint: str, argument: str, company_id=None, format='ndjson', output=None, slices=EXPORT_SLICES,
+               **filters):
     es = Elasticsearch([{'host': 'localhost', 'port': '9200'}])
     if endpoint == 'search':
-        print(search(es, 'companies', argument))
+        print(search(es, COMPANIES_INDEX_NAME, argument))
+    elif endpoint == 'export':
+        query = get_company_contracts_query(company_id) if company_id else get_contract_query(argument, **filters)
+        with open(output, 'w', encoding='utf-8', newline='') if output else nullcontext(sys.stdout) as f:
+            if format == 'csv':
+                f.write(format_csv([], header=True))
+            export(es, CONTRACTS_INDEX_NAME, query, slices,
+                   lambda page: f.write(format_csv(page) if format == 'csv' else format_ndjson(page)))
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,5 +1,14 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from elasticsearch import Elasticsearch
 
+# Constants
+SCROLL_KEEP_ALIVE = "2m"
+SCROLL_PAGE_SIZE = 1000
+DONE = None
+
 
 def search(es: Elasticsearch, index_name: str, query: str):
     return es.search(index=index_name, body={
@@ -22,3 +31,53 @@ def get_by_id(es: Elasticsearch, index_name: str, doc_id: str):
         }
     })
 
+
+def export(es: Elasticsearch, index_name: str, query: dict, slices: int, write_page, size=SCROLL_PAGE_SIZE):
+    # Every slice of the index is scrolled by a thread. The pages are written by the calling thread as they arrive,
+    # through a queue with room for a page per slice, so the memory does not grow with the number of hits.
+    pages = queue.Queue(maxsize=slices)
+    stopped = threading.Event()
+
+    def export_slice(slice_id: int):
+        try:
+            for page in scroll_slice(es, index_name, query, slice_id, slices, size):
+                if stopped.is_set():
+                    break
+                pages.put(page)
+        finally:
+            pages.put(DONE)
+
+    with ThreadPoolExecutor(max_workers=slices) as executor:
+        futures = [executor.submit(export_slice, slice_id) for slice_id in range(slices)]
+        remaining = slices
+        try:
+            while remaining:
+                page = pages.get()
+                if page is DONE:
+                    remaining -= 1
+                else:
+                    write_page(page)
+        finally:
+            # If writing fails, the threads are stopped and the queue is drained so they can finish
+            stopped.set()
+            while remaining:
+                if pages.get() is DONE:
+                    remaining -= 1
+        for future in futures:
+            future.result()
+
+
+def scroll_slice(es: Elasticsearch, index_name: str, query: dict, slice_id: int, slices: int,
+                 size=SCROLL_PAGE_SIZE):
+    body = {"query": query, "sort": ["_doc"]}
+    if slices > 1:
+        body["slice"] = {"id": slice_id, "max": slices}
+    response = es.search(index=index_name, body=body, size=size, scroll=SCROLL_KEEP_ALIVE)
+    scroll_id = response.get("_scroll_id")
+    try:
+        while response["hits"]["hits"]:
+            yield response["hits"]["hits"]
+            response = es.scroll(scroll_id=scroll_id, scroll=SCROLL_KEEP_ALIVE)
+            scroll_id = response.get("_scroll_id")
+    finally:
+        es.clear_scroll(scroll_id=scroll_id, ignore=404)
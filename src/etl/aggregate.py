@@ -0,0 +1,136 @@
+import heapq
+import json
+import os
+import tempfile
+from collections import defaultdict
+from itertools import groupby
+
+# Constants
+DEFAULT_MAX_COMPANIES = 500000
+TOP_ORGANOS = 10
+
+
+# Groups the awardees of many contracts by company id. When more than max_companies are held in memory they are
+# written, sorted by id, to a temporary file and merged back when iterating.
+class CompanyAggregator:
+    def __init__(self, max_companies=DEFAULT_MAX_COMPANIES, spill_dir=None):
+        self.max_companies = max_companies
+        self.spill_dir = spill_dir
+        self.companies = {}
+        self.spill_files = []
+
+    def add(self, doc_id: str, name: str, nif: str, date_str: str):
+        company = self.companies.get(doc_id)
+        if company is None:
+            self.companies[doc_id] = {
+                "nombre": name,
+                "nif": nif,
+                "aliases": {name},
+                "first_seen": date_str,
+                "last_seen": date_str,
+            }
+            if len(self.companies) >= self.max_companies:
+                self._spill()
+        else:
+            company["aliases"].add(name)
+            if date_str < company["first_seen"]:
+                company["nombre"] = name
+                company["first_seen"] = date_str
+            company["last_seen"] = max(company["last_seen"], date_str)
+
+    def __iter__(self):
+        if not self.spill_files:
+            for doc_id, company in sorted(self.companies.items()):
+                yield doc_id, _to_doc(company)
+            return
+        self._spill()
+        runs = [_read_run(path) for path in self.spill_files]
+        for doc_id, entries in groupby(heapq.merge(*runs, key=lambda entry: entry[0]), key=lambda entry: entry[0]):
+            companies = [company for _, company in entries]
+            merged = min(companies, key=lambda company: company["first_seen"])
+            merged["aliases"] = sorted(set(alias for company in companies for alias in company["aliases"]))
+            merged["last_seen"] = max(company["last_seen"] for company in companies)
+            yield doc_id, merged
+
+    def close(self):
+        for path in self.spill_files:
+            os.remove(path)
+        self.spill_files = []
+        self.companies = {}
+
+    def _spill(self):
+        if not self.companies:
+            return
+        fd, path = tempfile.mkstemp(prefix="companies-", suffix=".ndjson", dir=self.spill_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for doc_id, company in sorted(self.companies.items()):
+                f.write(json.dumps([doc_id, _to_doc(company)], ensure_ascii=False) + "\n")
+        print(f"Spilled {len(self.companies)} companies to {path}")
+        self.spill_files.append(path)
+        self.companies = {}
+
+
+# Totals of the awardings of a company, overall, by month and by contracting organ
+class CompanyStats:
+    def __init__(self, nif: str):
+        self.nif = nif
+        self.name = None
+        self.name_date = None
+        self.names = set()
+        self.vat_included = 0
+        self.vat_excluded = 0
+        self.contracts = 0
+        self.first_date = None
+        self.last_date = None
+        self.months = defaultdict(lambda: [0, 0])
+        self.organos = defaultdict(lambda: [0, 0])
+        self.competitors = []
+
+    def add(self, awardees: list, date_str, organo):
+        # Adds a contract, with the lots of it awarded to the company. The name of the company is the one of its most
+        # recent contract
+        if self.name is None or (date_str is not None and (self.name_date is None or date_str >= self.name_date)):
+            self.name = awardees[-1].get("name")
+            self.name_date = date_str
+        self.names.update(awardee["name"] for awardee in awardees if awardee.get("name"))
+        vat_included = sum(awardee.get("vat_included") or 0 for awardee in awardees)
+        self.vat_included += vat_included
+        self.vat_excluded += sum(awardee.get("vat_excluded") or 0 for awardee in awardees)
+        self.contracts += 1
+        if date_str:
+            self.first_date = min(self.first_date or date_str, date_str)
+            self.last_date = max(self.last_date or date_str, date_str)
+            month = self.months[date_str[0:7]]
+            month[0] += 1
+            month[1] += vat_included
+        if organo:
+            organo_totals = self.organos[organo]
+            organo_totals[0] += 1
+            organo_totals[1] += vat_included
+
+    def to_doc(self) -> dict:
+        top_organos = sorted(self.organos.items(), key=lambda item: (-item[1][1], item[0]))[:TOP_ORGANOS]
+        return {
+            "nombre": self.name,
+            "nif": self.nif,
+            "total_vat_included": round(self.vat_included, 2),
+            "total_vat_excluded": round(self.vat_excluded, 2),
+            "contract_count": self.contracts,
+            "first_date": self.first_date,
+            "last_date": self.last_date,
+            "monthly": [{"month": month, "contracts": contracts, "vat_included": round(vat_included, 2)}
+                        for month, (contracts, vat_included) in sorted(self.months.items())],
+            "top_organos": [{"organo": organo, "contracts": contracts, "vat_included": round(vat_included, 2)}
+                            for organo, (contracts, vat_included) in top_organos],
+            "competitors": self.competitors,
+        }
+
+
+def _to_doc(company: dict) -> dict:
+    return dict(company, aliases=sorted(company["aliases"]))
+
+
+def _read_run(path: str):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
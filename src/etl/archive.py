@@ -0,0 +1,88 @@
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+
+# Constants
+ARCHIVE_EXTENSION = '.html.zip'
+PAGE_EXTENSION = '.html'
+
+
+# The pages of a day are packed in a single compressed YYYY/MM/YYYY-MM-DD.html.zip archive, one member per contract
+# named <cid>.html. The central directory of the archive holds the offset of every member, so a page can be read
+# without decompressing the others.
+def get_archive_path(dir_path: str, date: datetime) -> str:
+    return os.path.join(dir_path, date.strftime('%Y'), date.strftime('%m'),
+                        f"{date.strftime('%Y-%m-%d')}{ARCHIVE_EXTENSION}")
+
+
+def list_pages(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with zipfile.ZipFile(path) as archive:
+        return [_get_cid(name) for name in archive.namelist()]
+
+
+def read_page(path: str, cid: str) -> str:
+    with zipfile.ZipFile(path) as archive:
+        return archive.read(f"{cid}{PAGE_EXTENSION}").decode("utf-8")
+
+
+def read_archive(path: str):
+    # Yields the (cid, contents) of the pages in the order they are stored
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            yield _get_cid(info.filename), archive.read(info).decode("utf-8")
+
+
+def read_pages(paths: list):
+    # Yields the (cid, contents) of the pages in a list of archives and single page files
+    for path in paths:
+        if path.endswith(ARCHIVE_EXTENSION):
+            yield from read_archive(path)
+        else:
+            with open(path, 'r') as f:
+                yield os.path.basename(path).replace(PAGE_EXTENSION, ''), f.read()
+
+
+def append_pages(path: str, pages: dict):
+    # Adds the given (cid: content) pages to the archive, which is created if it does not exist. The pages are written
+    # after the existing ones, which are not read again, and the pages already in the archive are kept.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(path, 'a', compression=zipfile.ZIP_DEFLATED) as archive:
+        names = set(archive.namelist())
+        for cid, content in pages.items():
+            name = f"{cid}{PAGE_EXTENSION}"
+            if name not in names:
+                archive.writestr(name, content)
+                names.add(name)
+
+
+def update_archive(path: str, pages: dict):
+    # Writes a new archive with the pages of the existing one and the given (cid: content) pages, sorted by cid, and
+    # replaces the existing one when it is complete
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    os.chmod(tmp_path, 0o644)
+    os.close(fd)
+    try:
+        existing = zipfile.ZipFile(path) if os.path.exists(path) else None
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                names = set(existing.namelist() if existing is not None else [])
+                names.update(f"{cid}{PAGE_EXTENSION}" for cid in pages)
+                for name in sorted(names):
+                    cid = _get_cid(name)
+                    content = pages[cid] if cid in pages else existing.read(name)
+                    archive.writestr(name, content)
+        finally:
+            if existing is not None:
+                existing.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _get_cid(name: str) -> str:
+    return name[:-len(PAGE_EXTENSION)] if name.endswith(PAGE_EXTENSION) else name
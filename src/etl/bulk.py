@@ -0,0 +1,89 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import streaming_bulk
+
+# Constants
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+DEFAULT_THREAD_COUNT = 4
+DEFAULT_MAX_RETRIES = 5
+INITIAL_BACKOFF = 2
+MAX_BACKOFF = 60
+MAX_REPORTED_ERRORS = 5
+
+
+class BulkSummary:
+    def __init__(self, name: str):
+        self.name = name
+        self.succeeded = 0
+        self.failed = 0
+        self.unchanged = 0
+        # Awardees of the contracts that could not be linked to a company
+        self.unlinked = 0
+        self.results = Counter()
+        self.errors = Counter()
+        self.failed_ids = []
+
+    def add(self, ok: bool, item: dict):
+        op_type, info = next(iter(item.items()))
+        if ok:
+            self.succeeded += 1
+            self.results[info.get("result", op_type)] += 1
+        else:
+            self.failed += 1
+            error = info.get("error")
+            if isinstance(error, dict):
+                self.errors[error.get("type", "unknown")] += 1
+            elif "exception" in info:
+                self.errors[type(info["exception"]).__name__] += 1
+            else:
+                self.errors[str(error)] += 1
+            self.failed_ids.append(info.get("_id"))
+
+    def __str__(self):
+        # Documents that were not sent because they have not changed are counted as unchanged, as the ones that
+        # Elasticsearch did not modify (noop)
+        inserted = self.results["created"]
+        updated = self.succeeded - inserted - self.results["noop"]
+        unchanged = self.unchanged + self.results["noop"]
+        summary = (f"{self.name}: {inserted} inserted, {updated} updated, {unchanged} unchanged, "
+                   f"{self.failed} failed")
+        if self.unlinked:
+            summary += f", {self.unlinked} awardees not linked to a company"
+        if self.failed:
+            errors = ", ".join(f"{error} ({count})" for error, count in self.errors.most_common(MAX_REPORTED_ERRORS))
+            ids = ", ".join(str(doc_id) for doc_id in self.failed_ids[:MAX_REPORTED_ERRORS])
+            summary += f". Errors: {errors}. First failed ids: {ids}"
+        return summary
+
+
+def bulk_load(es: Elasticsearch, actions, summary: BulkSummary, chunk_size=DEFAULT_CHUNK_SIZE,
+              max_chunk_bytes=DEFAULT_MAX_CHUNK_BYTES, thread_count=DEFAULT_THREAD_COUNT,
+              max_retries=DEFAULT_MAX_RETRIES) -> BulkSummary:
+    def send(chunk):
+        # streaming_bulk splits the chunk again if it goes over max_chunk_bytes and retries rejected (429) items
+        # with exponential backoff
+        return list(streaming_bulk(es, chunk, chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+                                   raise_on_error=False, raise_on_exception=False, max_retries=max_retries,
+                                   initial_backoff=INITIAL_BACKOFF, max_backoff=MAX_BACKOFF))
+
+    actions = iter(actions)
+    pending = set()
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        for chunk in iter(lambda: list(islice(actions, chunk_size)), []):
+            # Keep a bounded number of chunks in flight so the actions iterator is consumed lazily
+            if len(pending) >= thread_count * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done, summary)
+            pending.add(executor.submit(send, chunk))
+        _collect(pending, summary)
+    return summary
+
+
+def _collect(futures, summary: BulkSummary):
+    for future in futures:
+        for ok, item in future.result():
+            summary.add(ok, item)
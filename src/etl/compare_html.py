@@ -0,0 +1,171 @@
+import argparse
+import glob
+import json
+import locale
+import os
+import time
+from datetime import datetime
+from itertools import islice
+
+from bs4 import BeautifulSoup, Comment
+
+from archive import read_pages, ARCHIVE_EXTENSION
+from transform import parse_html
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CLI to check that the HTML parser returns the same contracts as the '
+                                                 'reference BeautifulSoup implementation')
+    parser.add_argument('--input-dir-path', default=os.path.dirname(__file__))
+    parser.add_argument('--limit', type=int, help="Maximum number of pages to compare")
+    if not compare(**vars(parser.parse_args())):
+        exit(1)
+
+
+def compare(input_dir_path: str, limit=None) -> bool:
+    paths = sorted(glob.glob(input_dir_path + '/**/*.html', recursive=True) +
+                   glob.glob(input_dir_path + f'/**/*{ARCHIVE_EXTENSION}', recursive=True))
+    pages = list(islice(read_pages(paths), limit))
+    reference_time = 0
+    fast_time = 0
+    mismatches = 0
+    for cid, contents in pages:
+        start = time.perf_counter()
+        expected = parse_html_reference(contents, cid)
+        reference_time += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = parse_html(contents, cid)
+        fast_time += time.perf_counter() - start
+        if (json.dumps(expected, ensure_ascii=False, indent=4) != json.dumps(actual, ensure_ascii=False, indent=4)):
+            mismatches += 1
+            print(f"Different output for page {cid}")
+    if pages:
+        print(f"{len(pages)} pages compared. {mismatches} different. "
+              f"Reference: {reference_time / len(pages) * 1000:.2f} ms/page. "
+              f"Fast: {fast_time / len(pages) * 1000:.2f} ms/page. "
+              f"Speedup: {reference_time / fast_time:.1f}x")
+    return mismatches == 0
+
+
+# Implementation of transform_html before the targeted parsing, kept as reference
+def parse_html_reference(contents: str, cid: str) -> dict:
+    locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')
+    soup = BeautifulSoup(contents, 'html.parser')
+    title = soup.find("h2", {"class", "tit11gr3"})
+    for element in title(text=lambda text: isinstance(text, Comment)):
+        element.extract()
+    contract = {
+        "titulo": title.string
+    }
+    soup.find("h2", {"class", "tit11gr3"})
+    contract_attr_lists = soup.findAll("div", {"class": "listado"})
+    for contract_attr_list in contract_attr_lists:
+        contract_attrs = contract_attr_list.findAll("li", {"class": "txt08gr3"})
+        total_vat_included = 0
+        awardees = []
+        for attr in contract_attrs:
+            for linebreak in attr.find_all('br'):
+                linebreak.extract()
+            if attr.find("strong") is not None:
+                attr_name = attr.find("strong").string.replace("\n", "")
+                attr.find("strong").extract()
+                attr_value = attr.text.replace("\n", "")
+                attr_mapping = {
+                    "Estado de la licitación": "estado",
+                    "Tipo resolución": "tipo-resolucion",
+                    "Resultado": "tipo-resolucion",
+                    "Objeto del contrato": "objeto-contrato",
+                    "Código CPV": "codigo-cpv",
+                    "Tipo Publicación": "actuacion",
+                    "Número de expediente": "numero-expediente",
+                    "Referencia": "referencia",
+                    "Tipo de contrato": "tipo",
+                    "Código NUTS": "codigo-nuts",
+                    "Procedimiento Adjudicación": "procedimiento",
+                    "Valor estimado sin I.V.A": "importe-sin-iva",
+                    "Presupuesto base licitación (sin impuestos)": "presupuesto-sin-iva",
+                    "Presupuesto base licitación. Importe total": "presupuesto-con-iva",
+                    "Duración del contrato": "duracion",
+                }
+                if attr_name in attr_mapping:
+                    contract[attr_mapping[attr_name]] = attr_value
+                elif attr_name == "Compra pública innovadora":
+                    contract["compra-innovadora"] = False if attr_value == "No" else True
+                elif attr_name in ("Formalización del contrato publicada el", "Contrato desierto el",
+                                   "Fecha del contrato",):
+                    contract["fecha-formalizacion"] = parse_contract_date_reference(attr_value)
+                elif attr_name == "Adjudicación del contrato publicada el":
+                    contract["fecha-adjudicacion"] = parse_contract_date_reference(attr_value)
+                elif attr_name in (
+                        "Fecha límite de presentación de ofertas o solicitudes de participación",
+                        "Defectos u omisiones de la documentación publicados el",
+                        "Ofertas anormales o desproporcionadas publicadas el"):
+                    pass
+                elif attr_name in ("Fecha publicación de la licitación en el BOCM",
+                                   "Formalización del contrato publicada en BOCM el",
+                                   "Fecha de publicación",
+                                   "Renuncia del contrato publicada el",
+                                   "Desistimiento del contrato publicado el"):
+                    contract["fecha-publicacion"] = parse_contract_date_reference(attr_value)
+                elif attr_name == "Entidad adjudicadora":
+                    if "→" in attr_value:
+                        entity = attr_value.split("→")
+                    else:
+                        entity = attr_value.split('··>')
+                    contract['organo'] = " > ".join(entity[0:2]).strip()
+                    contract['suborgano'] = entity[2].strip() if len(entity) > 2 else None
+                elif attr_name in ("Puntos de Información", "Otros Anuncios", "Modalidad", "Número de ofertas"):
+                    pass
+                else:
+                    print(f"Attribute skipped: {attr_name} - {attr_value}. CID: {cid}")
+            elif attr.find("table", {"class": "tableAdjudicacion"}) is not None:
+                table = attr.find("table", {"class": "tableAdjudicacion"})
+                header = table.find("thead").extract()
+                rows = table.findAll("tr")
+                if header.find("th").find("span").string == "RESULTADOS DE LA LICITACIÓN":
+                    for row in rows:
+                        cells = row.findAll("td")
+                        result = cells[2].string
+                        if result not in ("Desierto", "Desistimiento", "Renuncia", "", None):
+                            awardee = {
+                                "lote": cells[0].string,
+                                "num-ofertas": int(cells[1].string),
+                                "resultado": result,
+                                "nif": cells[3].string,
+                                "name": cells[4].string,
+                                "vat_excluded": float(cells[5].string.replace(".", "").replace(",", ".")),
+                                "vat_included": float(cells[6].string.replace(".", "").replace(",", ".")),
+                            }
+                            total_vat_included += awardee["vat_included"]
+                            awardees.append(awardee)
+            else:
+                raise ValueError(f"Attribute not expected: {attr}")
+    contract["url"] = ("http://www.madrid.org/cs/Satellite?"
+                       "c=CM_ConvocaPrestac_FA&"
+                       f"{'idoc' if '-' in cid else 'cid'}={cid}"
+                       "&definicion=Contratos+Publicos"
+                       "&language=es"
+                       "&op2=PCON"
+                       "&pagename=PortalContratacion%2FPage%2FPCON_contratosPublicos"
+                       "&tipoServicio=CM_ConvocaPrestac_FA")
+    # Convert types
+    for key in ("importe-sin-iva", "presupuesto-sin-iva", "presupuesto-con-iva"):
+        contract[key] = (float(contract[key].replace(" euros", "").replace(".", "").replace(",", "."))
+                         if key in contract else None)
+    contract["importe-con-iva"] = total_vat_included
+    contract["adjudicatario"] = awardees
+    contract["cid"] = cid
+    return contract
+
+
+def parse_contract_date_reference(date_str) -> str:
+    date_list = date_str.strip().split(" ")
+    date_list[1] = date_list[1].capitalize()
+    if len(date_list) == 4:
+        date_list = date_list[0:3]
+    date_str = " ".join(date_list)
+    return datetime.strptime(date_str, '%d %B %Y').strftime("%Y-%m-%d")
+
+
+if __name__ == '__main__':
+    main()
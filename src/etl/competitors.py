@@ -0,0 +1,71 @@
+import heapq
+from array import array
+from collections import Counter, defaultdict
+
+# Constants
+DEFAULT_TOP_COMPETITORS = 10
+MAX_GROUP_SIZE = 500
+CPV_PREFIX_LENGTH = 4
+
+
+# Companies compete when they are awarded contracts of the same organ in the same year, or of the same kind (type of
+# contract and CPV class) in the same year. Every organ, kind and year is a group of companies, and the companies are
+# linked through the groups they share, weighted by 1 / (size of the group - 1), so a small group is a stronger link
+# than a large one. Only the groups of every company are kept (a sparse company x group incidence matrix); the
+# competitors of a company are computed from its groups when they are requested, so the company x company matrix is
+# never held in memory.
+class CompetitorGraph:
+    def __init__(self, max_group_size=MAX_GROUP_SIZE):
+        self.max_group_size = max_group_size
+        self.companies = {}
+        self.company_ids = []
+        self.groups = defaultdict(set)
+        self._members = None
+        self._company_groups = None
+
+    def add(self, company_id: str, contract: dict):
+        year = (contract.get("fecha-formalizacion") or "")[0:4]
+        if not year:
+            return
+        if company_id not in self.companies:
+            self.companies[company_id] = len(self.company_ids)
+            self.company_ids.append(company_id)
+        company = self.companies[company_id]
+        if contract.get("organo"):
+            self.groups[("organo", contract["organo"], year)].add(company)
+        cpv = (contract.get("codigo-cpv") or "")[0:CPV_PREFIX_LENGTH] or None
+        if cpv or contract.get("tipo"):
+            self.groups[("kind", contract.get("tipo"), cpv, year)].add(company)
+
+    def get_competitors(self, company_id: str, top=DEFAULT_TOP_COMPETITORS) -> list:
+        # Returns the (id, score, shared groups) of the companies with the highest score
+        if self._company_groups is None:
+            self._build_index()
+        company = self.companies.get(company_id)
+        if company is None:
+            return []
+        scores = defaultdict(float)
+        shared = Counter()
+        for group in self._company_groups[company]:
+            members = self._members[group]
+            weight = 1 / (len(members) - 1)
+            for other in members:
+                scores[other] += weight
+                shared[other] += 1
+        scores.pop(company, None)
+        best = heapq.nlargest(top, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.company_ids[other], score, shared[other]) for other, score in best]
+
+    def _build_index(self):
+        # Groups of a single company link no one, and very large ones (e.g. an organ that awards hundreds of
+        # companies every year) hardly tell anything about competition while their cost grows with the square of
+        # their size, so both are left out
+        self._members = []
+        self._company_groups = [array('I') for _ in self.company_ids]
+        for members in self.groups.values():
+            if 1 < len(members) <= self.max_group_size:
+                group = len(self._members)
+                self._members.append(array('I', sorted(members)))
+                for company in members:
+                    self._company_groups[company].append(group)
+        self.groups = None
@@ -1,8 +1,13 @@
-import requests
+import asyncio
 import os
 import argparse
 from datetime import datetime, timedelta
 
+import aiohttp
+from yarl import URL
+
+from fetching import create_session, fetch, atomic_write, is_day_closed, DEFAULT_CONCURRENCY, DEFAULT_RETRIES
+
 # Constants
 BASE_URL = "http://www.madrid.org/cs/FileServlet"
 
@@ -14,6 +19,12 @@ def main():
     parser.add_argument('--end-date', type=valid_date, default=datetime.now(), help="End date (Format %Y-%m-%d")
     parser.add_argument('--dir-path', default=os.path.dirname(__file__), help="End date (Format %Y-%m-%d")
     parser.add_argument('--no-partition', action="store_true", help="Downloads the data in a single file")
+    parser.add_argument('--base-url', default=BASE_URL, help="URL of the service that exports the CSV files")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of simultaneous downloads")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help="Number of retries of a failed download")
+    parser.add_argument('--force', action="store_true", help="Downloads the files that already exist again")
     extract(**vars(parser.parse_args()))
 
 
@@ -25,30 +36,69 @@ def valid_date(s: str) -> datetime:
         raise argparse.ArgumentTypeError(msg)
 
 
-def extract(start_date: datetime, end_date: datetime, dir_path: str, no_partition=False):
+def extract(start_date: datetime, end_date: datetime, dir_path: str, no_partition=False, base_url=BASE_URL,
+            concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES, force=False):
     if no_partition:
         start_date = (start_date - timedelta(days=1)).strftime('%Y-%m-%d')
         end_date = end_date.strftime('%Y-%m-%d')
         path = os.path.join(dir_path, f"{start_date}-{end_date}.csv")
-        download_file(start_date, end_date, path)
+        downloads = [(start_date, end_date, path)]
     else:
-        day_count = (end_date - start_date).days + 1
-        for date in [d for d in (start_date + timedelta(n) for n in range(day_count)) if d <= end_date]:
-            date_str = date.strftime('%Y-%m-%d')
-            prev_date_str = (date - timedelta(days=1)).strftime('%Y-%m-%d')
-            path = os.path.join(dir_path, date.strftime('%Y'), date.strftime('%m'), f"{date_str}.csv")
-            download_file(prev_date_str, date_str, path)
+        downloads = list(get_downloads(start_date, end_date, dir_path))
+    if not force:
+        # The files of the days that are not closed yet are downloaded again, as they can still grow
+        downloads = [download for download in downloads
+                     if not os.path.exists(download[2]) or not is_day_closed(download[1])]
+    asyncio.run(download_files(downloads, base_url, concurrency, retries))
+
+
+def get_downloads(start_date: datetime, end_date: datetime, dir_path: str):
+    day_count = (end_date - start_date).days + 1
+    for date in [d for d in (start_date + timedelta(n) for n in range(day_count)) if d <= end_date]:
+        date_str = date.strftime('%Y-%m-%d')
+        prev_date_str = (date - timedelta(days=1)).strftime('%Y-%m-%d')
+        yield prev_date_str, date_str, get_csv_path(dir_path, date)
+
+
+def get_csv_path(dir_path: str, date: datetime) -> str:
+    return os.path.join(dir_path, date.strftime('%Y'), date.strftime('%m'), f"{date.strftime('%Y-%m-%d')}.csv")
+
+
+async def download_files(downloads: list, base_url=BASE_URL, concurrency=DEFAULT_CONCURRENCY,
+                         retries=DEFAULT_RETRIES):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded_download(start_date: str, end_date: str, path: str):
+        async with semaphore:
+            await download_file(session, start_date, end_date, path, base_url, retries)
+
+    async with create_session(concurrency) as session:
+        results = await asyncio.gather(*(bounded_download(*download) for download in downloads),
+                                       return_exceptions=True)
+    failed = [(download[2], result) for download, result in zip(downloads, results) if isinstance(result, Exception)]
+    for path, error in failed:
+        print(f"Failed to download {path}: {error!r}")
+    print(f"Downloaded {len(downloads) - len(failed)} files. {len(failed)} failed")
+
+
+async def download_file(session: aiohttp.ClientSession, start_date: str, end_date: str, path: str,
+                        base_url=BASE_URL, retries=DEFAULT_RETRIES):
+    print(f"Downloading data from {get_csv_url(start_date, end_date, base_url)} to {path}")
+    content = await fetch_csv(session, start_date, end_date, base_url, retries)
+    atomic_write(path, content.encode("utf-8"))
+
+
+async def fetch_csv(session: aiohttp.ClientSession, start_date: str, end_date: str, base_url=BASE_URL,
+                    retries=DEFAULT_RETRIES) -> str:
+    url = get_csv_url(start_date, end_date, base_url)
+    content = await fetch(session, "GET", URL(url, encoded=True), retries=retries, allow_redirects=True)
+    return content.decode("iso-8859-1")
 
 
-def download_file(start_date: str, end_date: str, path: str):
+def get_csv_url(start_date: str, end_date: str, base_url=BASE_URL) -> str:
     query_filter = f"FechaPublicacionAdjudicacion:[{start_date}T23:00:00.000Z+TO+{end_date}T22:59:59.999Z]"
     query = f"fq=({query_filter})"
-    url = f"{BASE_URL}?{query}"
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    print(f"Downloading data from {url} to {path}")
-    r = requests.get(url, allow_redirects=True)
-    with open(path, 'w') as f:
-        f.write(r.content.decode("iso-8859-1"))
+    return f"{base_url}?{query}"
 
 
 if __name__ == '__main__':
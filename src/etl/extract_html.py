@@ -1,15 +1,30 @@
+import asyncio
+import json
 import re
 import os
-import http.client
 import argparse
+from collections import deque
 from datetime import datetime, timedelta
 
+import aiohttp
 from bs4 import BeautifulSoup
 
+from archive import append_pages, get_archive_path, list_pages, update_archive
+from fetching import (create_session, fetch, atomic_write, is_day_closed, RateLimiter, DEFAULT_CONCURRENCY,
+                      DEFAULT_RETRIES)
+
 # Constants
 SEARCH_URL = "/cs/Satellite"
-BASE_URL = "www.madrid.org"
+BASE_URL = "http://www.madrid.org"
 CID_REGEX = r"cid=(\d+)"
+CONTRACT_PREFIX = "/cs/Satellite?c=CM_ConvocaPrestac_FA&"
+STATE_FILENAME = ".crawl-state.json"
+DEFAULT_RATE_LIMIT = 0.1
+DAY_CONCURRENCY = 4
+# Number of downloaded pages written to the archive of the day at a time
+ARCHIVE_BATCH_SIZE = 100
+BOUNDARY = "---011000010111000001101001"
+
 
 def main():
     parser = argparse.ArgumentParser(description='CLI to download contracts information in HTML format')
@@ -17,6 +32,14 @@ def main():
                         help="Start date (Format %Y-%m-%d")
     parser.add_argument('--end-date', type=valid_date, default=datetime.now(), help="End date (Format %Y-%m-%d")
     parser.add_argument('--dir-path', default=os.path.dirname(__file__), help="End date (Format %Y-%m-%d")
+    parser.add_argument('--base-url', default=BASE_URL, help="URL of the contracting portal")
+    parser.add_argument('--parallelism', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of simultaneous requests")
+    parser.add_argument('--rate-limit', type=float, default=DEFAULT_RATE_LIMIT,
+                        help="Minimum number of seconds between the start of two requests")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help="Number of retries of a failed request")
+    parser.add_argument('--state-path', help=f"Crawl state file (Default: {STATE_FILENAME} in --dir-path)")
+    parser.add_argument('--force', action="store_true", help="Crawls the days already completed again")
     extract(**vars(parser.parse_args()))
 
 
@@ -28,86 +51,170 @@ def valid_date(s: str) -> datetime:
         raise argparse.ArgumentTypeError(msg)
 
 
-def get_contract_urls(date: datetime, next_page=None, pages=None, urls=None):
-    if pages is None:
-        print(f"Date: {date.strftime('%d/%m/%Y')}")
-    if urls is None:
-        urls = []
-    conn = http.client.HTTPConnection(BASE_URL)
-    date_str = date.strftime('%d/%m/%Y')
-    if next_page:
-        conn.request("GET", next_page)
-    else:
-        payload = ("-----011000010111000001101001\r\n"
-                   "Content-Disposition: form-data; "
-                   "name=\"_charset_\"\r\n\r\nUTF-8\r\n"
-                   "-----011000010111000001101001\r\n"
-                   "Content-Disposition: form-data; "
-                   "name=\"pagename\"\r\n\r\nPortalContratacion/Comunes/Presentacion/PCON_resultadoBuscadorAvanzado\r\n"
-                   "-----011000010111000001101001\r\n"
-                   "Content-Disposition: form-data; name=\"language\"\r\n\r\nes\r\n"
-                   "-----011000010111000001101001\r\n"
-                   f"Content-Disposition: form-d"
-                   f""
-                   f""
-                   f"ata; name=\"fechaFormalizacionDesde\"\r\n\r\n{date_str}\r\n"
-                   "-----011000010111000001101001\r\n"
-                   f"Content-Disposition: form-data; name=\"fechaFormalizacionHasta\"\r\n\r\n{date_str}\r\n"
-                   "-----011000010111000001101001--\r\n")
-        headers = {
-            'content-type': "multipart/form-data; boundary=---011000010111000001101001"
-        }
-        conn.request("POST", SEARCH_URL, payload, headers)
-    res = conn.getresponse()
-    data = res.read()
-    html_doc = data.decode("utf-8")
-    soup = BeautifulSoup(html_doc, 'html.parser')
-    links = soup.find_all("a")
-    for link in links:
-        href = link.get("href")
-        if href:
-            if href.startswith("/cs/Satellite?c=CM_ConvocaPrestac_FA&"):
-                urls.append("http://" + BASE_URL + href)
-            elif not next_page and 'newPagina=' in href:
-                if pages is None:
-                    pages = [href]
-                elif href not in pages:
-                    pages.append(href)
-    if pages:
-        next_page = pages.pop()
-        get_contract_urls(date, next_page, pages, urls)
-    return urls
-
-
-def extract(start_date: datetime, end_date: datetime, dir_path: str):
-    day_count = (end_date - start_date).days + 1
-    for date in [d for d in (start_date + timedelta(n) for n in range(day_count)) if d <= end_date]:
-        urls = get_contract_urls(date)
+class Crawler:
+    def __init__(self, session: aiohttp.ClientSession, dir_path: str, base_url=BASE_URL, rate_limit=DEFAULT_RATE_LIMIT,
+                 retries=DEFAULT_RETRIES, state_path=None):
+        self.session = session
+        self.dir_path = dir_path
+        self.base_url = base_url
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.retries = retries
+        self.state_path = state_path or os.path.join(dir_path, STATE_FILENAME)
+        self.completed = set()
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.completed = set(json.load(f)["completed"])
+
+    async def crawl_day(self, date: datetime):
+        # The pages of the day that are not in its archive yet are downloaded and appended to it in batches as they
+        # complete, so a failed download does not lose the others. Pages downloaded as single files before the
+        # archives are moved into it instead. The day is completed when all its pages are in the archive and no
+        # contracts can be published on it anymore.
+        date_str = date.strftime('%Y-%m-%d')
+        urls = await self.get_contract_urls(date)
+        print(f"Date: {date.strftime('%d/%m/%Y')}. {len(urls)} contracts")
+        archive_path = get_archive_path(self.dir_path, date)
+        archived = set(list_pages(archive_path))
+        pages = {}
+        moved = []
+        downloads = []
         for url in urls:
+            cid = get_contract_id(url)
+            if cid in archived:
+                continue
+            path = self.get_page_path(date, cid)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    pages[cid] = f.read()
+                moved.append(path)
+            else:
+                downloads.append(self.download_html(url))
+        error = None
+        for download in asyncio.as_completed(downloads):
             try:
-                cid = re.search(CID_REGEX, url).groups()[0]
-                idoc = None
-            except Exception:
-                cid = None
-                idoc = url.split('&')[2].replace('idoc=', '')
-            path = os.path.join(dir_path, date.strftime('%Y'), date.strftime('%m'), date.strftime('%d'),
-                                f"{cid or idoc}.html")
-            print(f"Downloading HTML file to {path}")
-            download_html(url, path)
-
-
-def download_html(url: str, path: str):
-    conn = http.client.HTTPConnection(BASE_URL)
-    conn.request("GET", url)
-    res = conn.getresponse()
-    data = res.read()
-    html_doc = data.decode("utf-8")
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    html_file = open(path, "w")
-    html_file.write(html_doc)
-    html_file.close()
+                cid, content = await download
+            except Exception as e:
+                error = error or e
+                continue
+            pages[cid] = content
+            if len(pages) >= ARCHIVE_BATCH_SIZE:
+                await self.write_pages(archive_path, pages)
+                pages = {}
+        if pages:
+            await self.write_pages(archive_path, pages)
+        for path in moved:
+            os.remove(path)
+        if moved and not os.listdir(os.path.dirname(moved[0])):
+            os.rmdir(os.path.dirname(moved[0]))
+        if error is not None:
+            raise error
+        if is_day_closed(date_str):
+            self.completed.add(date_str)
+            self.save_state()
+
+    async def fetch_day(self, date: datetime, persist=False) -> list:
+        # Returns the (contract id, contents) of the pages of the day without going through the disk. The pages are
+        # added to the archive of the day too if persist is set.
+        urls = await self.get_contract_urls(date)
+        pages = await asyncio.gather(*(self.download_html(url) for url in urls))
+        if persist and pages:
+            await asyncio.get_running_loop().run_in_executor(None, update_archive,
+                                                             get_archive_path(self.dir_path, date), dict(pages))
+        return [(cid, content.decode("utf-8")) for cid, content in pages]
+
+    async def write_pages(self, archive_path: str, pages: dict):
+        # Compressing and writing the pages runs in a thread, so the downloads go on meanwhile
+        print(f"Writing {len(pages)} pages to {archive_path}")
+        await asyncio.get_running_loop().run_in_executor(None, append_pages, archive_path, pages)
+
+    def get_page_path(self, date: datetime, cid: str) -> str:
+        # Location of the pages downloaded before the archives
+        return os.path.join(self.dir_path, date.strftime('%Y'), date.strftime('%m'), date.strftime('%d'),
+                            f"{cid}.html")
+
+    async def get_contract_urls(self, date: datetime) -> list:
+        urls = {}
+        html_doc = await self.request("POST", SEARCH_URL, data=get_search_payload(date),
+                                      headers={'content-type': f"multipart/form-data; boundary={BOUNDARY}"})
+        pages = deque()
+        seen_pages = set()
+        while html_doc is not None:
+            for link in BeautifulSoup(html_doc, 'html.parser').find_all("a"):
+                href = link.get("href")
+                if href:
+                    if href.startswith(CONTRACT_PREFIX):
+                        urls[href] = None
+                    elif 'newPagina=' in href and href not in seen_pages:
+                        seen_pages.add(href)
+                        pages.append(href)
+            html_doc = await self.request("GET", pages.popleft()) if pages else None
+        return [self.base_url + url for url in urls]
+
+    async def download_html(self, url: str) -> tuple:
+        print(f"Downloading HTML file from {url}")
+        content = await fetch(self.session, "GET", url, retries=self.retries, rate_limiter=self.rate_limiter)
+        return get_contract_id(url), content
+
+    async def request(self, method: str, path: str, **kwargs) -> str:
+        content = await fetch(self.session, method, self.base_url + path, retries=self.retries,
+                              rate_limiter=self.rate_limiter, **kwargs)
+        return content.decode("utf-8")
+
+    def save_state(self):
+        atomic_write(self.state_path, json.dumps({"completed": sorted(self.completed)}, indent=4).encode("utf-8"))
+
+
+def extract(start_date: datetime, end_date: datetime, dir_path: str, base_url=BASE_URL,
+            parallelism=DEFAULT_CONCURRENCY, rate_limit=DEFAULT_RATE_LIMIT, retries=DEFAULT_RETRIES, state_path=None,
+            force=False):
+    asyncio.run(crawl(start_date, end_date, dir_path, base_url, parallelism, rate_limit, retries, state_path, force))
+
+
+async def crawl(start_date: datetime, end_date: datetime, dir_path: str, base_url=BASE_URL,
+                parallelism=DEFAULT_CONCURRENCY, rate_limit=DEFAULT_RATE_LIMIT, retries=DEFAULT_RETRIES,
+                state_path=None, force=False):
+    semaphore = asyncio.Semaphore(DAY_CONCURRENCY)
+
+    async def bounded_crawl_day(date: datetime):
+        async with semaphore:
+            await crawler.crawl_day(date)
+
+    async with create_session(parallelism) as session:
+        crawler = Crawler(session, dir_path, base_url, rate_limit, retries, state_path)
+        day_count = (end_date - start_date).days + 1
+        dates = [d for d in (start_date + timedelta(n) for n in range(day_count)) if d <= end_date]
+        if not force:
+            dates = [date for date in dates if date.strftime('%Y-%m-%d') not in crawler.completed]
+        results = await asyncio.gather(*(bounded_crawl_day(date) for date in dates), return_exceptions=True)
+    failed = [(date, result) for date, result in zip(dates, results) if isinstance(result, Exception)]
+    for date, error in failed:
+        print(f"Failed to crawl {date.strftime('%Y-%m-%d')}: {error!r}")
+    print(f"Crawled {len(dates) - len(failed)} days. {len(failed)} failed")
+
+
+def get_search_payload(date: datetime) -> str:
+    date_str = date.strftime('%d/%m/%Y')
+    return (f"--{BOUNDARY}\r\n"
+            "Content-Disposition: form-data; "
+            "name=\"_charset_\"\r\n\r\nUTF-8\r\n"
+            f"--{BOUNDARY}\r\n"
+            "Content-Disposition: form-data; "
+            "name=\"pagename\"\r\n\r\nPortalContratacion/Comunes/Presentacion/PCON_resultadoBuscadorAvanzado\r\n"
+            f"--{BOUNDARY}\r\n"
+            "Content-Disposition: form-data; name=\"language\"\r\n\r\nes\r\n"
+            f"--{BOUNDARY}\r\n"
+            f"Content-Disposition: form-data; name=\"fechaFormalizacionDesde\"\r\n\r\n{date_str}\r\n"
+            f"--{BOUNDARY}\r\n"
+            f"Content-Disposition: form-data; name=\"fechaFormalizacionHasta\"\r\n\r\n{date_str}\r\n"
+            f"--{BOUNDARY}--\r\n")
+
+
+def get_contract_id(url: str) -> str:
+    match = re.search(CID_REGEX, url)
+    if match:
+        return match.groups()[0]
+    return url.split('&')[2].replace('idoc=', '')
 
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import tempfile
+from datetime import datetime
+
+import aiohttp
+
+# Constants
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RETRIES = 5
+INITIAL_BACKOFF = 1
+MAX_BACKOFF = 60
+REQUEST_TIMEOUT = 300
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def create_session(concurrency=DEFAULT_CONCURRENCY) -> aiohttp.ClientSession:
+    # A single connector keeps the connections alive and shares them between all the requests
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+
+
+class RateLimiter:
+    # Spaces the start of consecutive requests by at least interval seconds
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._next_time = 0
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_time - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_time = loop.time() + self.interval
+
+
+async def fetch(session: aiohttp.ClientSession, method: str, url: str, retries=DEFAULT_RETRIES, rate_limiter=None,
+                **kwargs) -> bytes:
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            await rate_limiter.wait()
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                if response.status in RETRY_STATUSES and attempt < retries:
+                    error = f"HTTP {response.status}"
+                else:
+                    response.raise_for_status()
+                    return await response.read()
+        except aiohttp.ClientResponseError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == retries:
+                raise
+            error = repr(e)
+        delay = min(MAX_BACKOFF, INITIAL_BACKOFF * 2 ** attempt)
+        print(f"Request to {url} failed: {error}. Retrying in {delay} seconds")
+        await asyncio.sleep(delay)
+
+
+def atomic_write(path: str, content: bytes):
+    # Write to a temporary file in the same directory and rename it, so a file that exists is always complete
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    os.chmod(tmp_path, 0o644)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def is_day_closed(date_str: str) -> bool:
+    # Contracts can still be published on the current day, so only the previous days are final
+    return date_str < datetime.now().strftime('%Y-%m-%d')
@@ -0,0 +1,95 @@
+import json
+import os
+import re
+import sqlite3
+from hashlib import sha1
+from itertools import islice
+
+from elasticsearch import Elasticsearch
+
+from bulk import BulkSummary, bulk_load
+
+# Constants
+HASHES_DIRNAME = ".doc-hashes"
+LOOKUP_BATCH_SIZE = 500
+
+
+# Keeps the content hash of every document loaded into an index, so documents that have not changed since they were
+# last loaded are not sent again. There is a store per concrete index, so a new generation starts empty.
+class HashStore:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS hashes (doc_id BLOB PRIMARY KEY, hash BLOB NOT NULL) "
+                                "WITHOUT ROWID")
+
+    def get_many(self, doc_ids) -> dict:
+        hashes = {}
+        doc_ids = iter(doc_ids)
+        for batch in iter(lambda: list(islice(doc_ids, LOOKUP_BATCH_SIZE)), []):
+            keys = {_to_key(doc_id): doc_id for doc_id in batch}
+            rows = self.connection.execute(f"SELECT doc_id, hash FROM hashes WHERE doc_id IN "
+                                           f"({', '.join('?' * len(keys))})", list(keys))
+            hashes.update((keys[key], content_hash) for key, content_hash in rows)
+        return hashes
+
+    def update(self, hashes: dict):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?)",
+                                        ((_to_key(doc_id), content_hash) for doc_id, content_hash in hashes.items()))
+
+    def close(self):
+        self.connection.close()
+
+
+def get_store_path(dir_path: str, index_name: str) -> str:
+    return os.path.join(dir_path, HASHES_DIRNAME, f"{index_name}.sqlite")
+
+
+def remove_stale_stores(dir_path: str, alias: str, generations):
+    # Removes the stores of the generations of the alias that have been deleted
+    regex = re.compile(rf"^({re.escape(alias)}-\d{{14}})\.sqlite$")
+    directory = os.path.join(dir_path, HASHES_DIRNAME)
+    for filename in os.listdir(directory) if os.path.isdir(directory) else []:
+        match = regex.match(filename)
+        if match and match.group(1) not in generations:
+            os.remove(os.path.join(directory, filename))
+
+
+def get_content_hash(action: dict) -> bytes:
+    # The index is left out, so the hash does not depend on whether the documents are written through the alias
+    content = {key: value for key, value in action.items() if key != "_index"}
+    return sha1(json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode()).digest()
+
+
+def bulk_load_changed(es: Elasticsearch, actions, summary: BulkSummary, store: HashStore, force=False,
+                      **bulk_options) -> BulkSummary:
+    # Only the actions of new or changed documents are sent. The hashes are stored once the documents are loaded,
+    # so a failed document is sent again in the next run.
+    sent = {}
+
+    def changed_actions():
+        remaining = iter(actions)
+        for batch in iter(lambda: list(islice(remaining, LOOKUP_BATCH_SIZE)), []):
+            hashes = {action["_id"]: get_content_hash(action) for action in batch}
+            stored = {} if force else store.get_many(hashes)
+            for action in batch:
+                if stored.get(action["_id"]) == hashes[action["_id"]]:
+                    summary.unchanged += 1
+                else:
+                    sent[action["_id"]] = hashes[action["_id"]]
+                    yield action
+
+    bulk_load(es, changed_actions(), summary, **bulk_options)
+    for doc_id in summary.failed_ids:
+        sent.pop(doc_id, None)
+    store.update(sent)
+    return summary
+
+
+def _to_key(doc_id: str) -> bytes:
+    # Document ids are sha1 hex digests, stored as raw bytes to halve the size of the store
+    try:
+        return bytes.fromhex(doc_id)
+    except ValueError:
+        return doc_id.encode()
@@ -0,0 +1,75 @@
+import os
+import re
+from datetime import datetime
+
+from elasticsearch import Elasticsearch
+
+from mappings import put_index_templates
+
+# Constants
+GENERATION_FORMAT = "%Y%m%d%H%M%S"
+DEFAULT_KEEP_GENERATIONS = 2
+META_INDEX_NAME = os.environ.get('META_INDEX_NAME', 'etl-meta')
+DATA_GENERATION_DOC_ID = "generation"
+
+
+# Every index is a generation named <alias>-<creation time>. The API reads from the alias, which points to a single
+# generation, so a new generation can be fully loaded before replacing the previous one.
+def get_generation_name(alias: str, date=None) -> str:
+    return f"{alias}-{(date or datetime.now()).strftime(GENERATION_FORMAT)}"
+
+
+def get_generations(es: Elasticsearch, alias: str) -> list:
+    regex = re.compile(rf"^{re.escape(alias)}-\d{{14}}$")
+    return sorted(name for name in es.indices.get(index=f"{alias}-*", ignore=404) if regex.match(name))
+
+
+def get_concrete_index(es: Elasticsearch, name: str) -> str:
+    # Returns the index an alias points to, or the name itself if it is an index
+    if es.indices.exists_alias(name=name):
+        return next(iter(es.indices.get_alias(name=name)))
+    return name
+
+
+def create_generation(es: Elasticsearch, alias: str, with_alias=False) -> str:
+    # The mappings and settings come from the index templates
+    put_index_templates(es)
+    index_name = get_generation_name(alias)
+    es.indices.create(index=index_name, body={"aliases": {alias: {}}} if with_alias else None)
+    return index_name
+
+
+def ensure_alias(es: Elasticsearch, alias: str):
+    # Creates a first generation if there is neither an alias nor an index (created before the aliases) with the name
+    put_index_templates(es)
+    if not es.indices.exists(index=alias):
+        create_generation(es, alias, with_alias=True)
+
+
+def swap_alias(es: Elasticsearch, alias: str, index_name: str):
+    # All the actions are applied atomically, so the alias always points to a complete generation
+    actions = [{"add": {"index": index_name, "alias": alias}}]
+    if es.indices.exists_alias(name=alias):
+        actions += [{"remove": {"index": current, "alias": alias}}
+                    for current in es.indices.get_alias(name=alias) if current != index_name]
+    elif es.indices.exists(index=alias):
+        actions.append({"remove_index": {"index": alias}})
+    es.indices.update_aliases(body={"actions": actions})
+    print(f"Alias {alias} points to {index_name}")
+
+
+def prune_generations(es: Elasticsearch, alias: str, keep=DEFAULT_KEEP_GENERATIONS):
+    # The newest generations are kept, so a swap can be undone, and the one the alias points to is never deleted
+    current = set(es.indices.get_alias(name=alias)) if es.indices.exists_alias(name=alias) else set()
+    generations = get_generations(es, alias)
+    for index_name in generations[:max(len(generations) - keep, 0)]:
+        if index_name not in current:
+            print(f"Deleting {index_name}")
+            es.indices.delete(index=index_name)
+
+
+def bump_data_generation(es: Elasticsearch):
+    # The API drops its cached responses when the data generation changes
+    generation = datetime.now().isoformat()
+    es.index(index=META_INDEX_NAME, id=DATA_GENERATION_DOC_ID, body={"generation": generation})
+    print(f"Data generation {generation}")
@@ -1,24 +1,79 @@
+import math
+from collections import defaultdict
+from contextlib import nullcontext
+from functools import partial
 from hashlib import sha1
-import json
-from elasticsearch import Elasticsearch, NotFoundError
+from itertools import islice
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan
 import os
 import argparse
 from datetime import datetime
-import glob
 import csv
 
-# Constants
-COMPANIES_INDEX_NAME = 'companies'
-CONTRACTS_INDEX_NAME = 'contracts'
+from aggregate import CompanyAggregator, CompanyStats, DEFAULT_MAX_COMPANIES
+from bulk import (BulkSummary, bulk_load, DEFAULT_CHUNK_SIZE, DEFAULT_MAX_CHUNK_BYTES, DEFAULT_THREAD_COUNT,
+                  DEFAULT_MAX_RETRIES)
+from competitors import CompetitorGraph, DEFAULT_TOP_COMPETITORS
+from hashes import HashStore, bulk_load_changed, get_store_path, remove_stale_stores, HASHES_DIRNAME
+from indices import (bump_data_generation, create_generation, ensure_alias, get_concrete_index, get_generations,
+                     prune_generations, swap_alias, DEFAULT_KEEP_GENERATIONS)
+from mappings import backfill_mode
+from manifest import Manifest, get_partition_name, hash_files, MANIFEST_FILENAME
+from partitions import get_partitions
+from records import read_records, RECORD_EXTENSIONS
+from resolver import CompanyResolver, DEFAULT_CACHE_SIZE
+
+# Constants. The index names are the aliases of the current generation of each index
+COMPANIES_INDEX_NAME = os.environ.get('COMPANIES_INDEX_NAME', 'companies')
+CONTRACTS_INDEX_NAME = os.environ.get('CONTRACTS_INDEX_NAME', 'contracts')
+COMPANY_STATS_INDEX_NAME = os.environ.get('COMPANY_STATS_INDEX_NAME', 'company_stats')
+SUGGESTIONS_INDEX_NAME = os.environ.get('SUGGESTIONS_INDEX_NAME', 'suggestions')
+RESOLVE_BATCH_SIZE = 1000
+SCAN_BATCH_SIZE = 2000
+COMPANY_STATS_SOURCE = ["adjudicatario.nif", "adjudicatario.name", "adjudicatario.vat_included",
+                        "adjudicatario.vat_excluded", "fecha-formalizacion", "organo", "codigo-cpv", "tipo"]
+SUGGESTION_SOURCE = ["titulo", "objeto-contrato", "importe-con-iva"]
+# Completion weights are integers below 2^31, so suggestions are ranked by the logarithm of their amount
+SUGGESTION_WEIGHT_SCALE = 1000000
+MAX_SUGGESTION_WORDS = 5
+# Parallel workers and bulk threads can update the same document at the same time
+RETRY_ON_CONFLICT = 3
 
 
 def main():
     parser = argparse.ArgumentParser(description='CLI to load data to Elasticsearch')
-    parser.add_argument('index_type', choices=['companies', 'contracts'])
+    parser.add_argument('index_type', choices=['companies', 'contracts', 'company-stats'])
     parser.add_argument('--start-date', type=valid_date, default=datetime(2008, 6, 1),
                         help="Start date (Format %Y-%m-%d")
     parser.add_argument('--end-date', type=valid_date, default=datetime.now(), help="End date (Format %Y-%m-%d")
     parser.add_argument('--dir-path', default=os.path.dirname(__file__), help="End date (Format %Y-%m-%d")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Maximum number of documents per bulk request")
+    parser.add_argument('--max-chunk-bytes', type=int, default=DEFAULT_MAX_CHUNK_BYTES,
+                        help="Maximum size in bytes of a bulk request")
+    parser.add_argument('--threads', dest='thread_count', type=int, default=DEFAULT_THREAD_COUNT,
+                        help="Number of threads sending bulk requests in parallel")
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help="Number of retries for documents rejected with a 429 status code")
+    parser.add_argument('--resolver-cache-path', help="File where the known company ids are cached between runs")
+    parser.add_argument('--resolver-cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help="Maximum number of company id lookups kept in memory")
+    parser.add_argument('--max-companies-in-memory', type=int, default=DEFAULT_MAX_COMPANIES,
+                        help="Maximum number of aggregated companies kept in memory before spilling to disk")
+    parser.add_argument('--manifest-path', help=f"ETL manifest file (Default: {MANIFEST_FILENAME} in --dir-path)")
+    parser.add_argument('--force', action="store_true",
+                        help="Loads the files and the documents that have not changed too")
+    parser.add_argument('--hashes-dir-path',
+                        help=f"Directory of the document hash stores (Default: {HASHES_DIRNAME} in --dir-path)")
+    parser.add_argument('--backfill', action="store_true",
+                        help="Disables refreshes and replicas during the load and force merges the index afterwards")
+    parser.add_argument('--rebuild', action="store_true",
+                        help="Loads all the files into a new index and points the alias to it when complete")
+    parser.add_argument('--keep-generations', type=int, default=DEFAULT_KEEP_GENERATIONS,
+                        help="Number of indices kept after a rebuild, including the new one")
+    parser.add_argument('--company-stats', action="store_true",
+                        help="Computes the company statistics and suggestions from all the contracts after loading")
     load(**vars(parser.parse_args()))
 
 
@@ -30,82 +85,358 @@ def valid_date(s: str) -> datetime:
         raise argparse.ArgumentTypeError(msg)
 
 
-def load(index_type: str, start_date: datetime, end_date: datetime, dir_path: str):
+def load(index_type: str, start_date: datetime, end_date: datetime, dir_path: str, resolver_cache_path=None,
+         resolver_cache_size=DEFAULT_CACHE_SIZE, max_companies_in_memory=DEFAULT_MAX_COMPANIES, manifest_path=None,
+         force=False, backfill=False, rebuild=False, keep_generations=DEFAULT_KEEP_GENERATIONS, hashes_dir_path=None,
+         company_stats=False, **bulk_options):
     es = Elasticsearch([{'host': 'localhost', 'port': '9200'}])
     csv.register_dialect('custom', delimiter=';')
-    for filename in glob.iglob(dir_path + '/**/*.json', recursive=True):
-        date_str = os.path.basename(filename).replace('.json', '')
-        date = datetime.strptime(date_str, "%Y-%m-%d")
-        if start_date <= date <= end_date:
-            with open(filename) as json_file:
-                data = json.load(json_file)
-            if index_type == "companies":
-                print(f"Loading companies for day {date_str}")
-                load_companies(es, data)
-            elif index_type == "contracts":
-                print(f"Loading contracts for day {date_str}")
-                load_contracts(es, data)
-            else:
-                raise NotImplemented()
+    if index_type == "company-stats":
+        load_company_stats(es, keep_generations, **bulk_options)
+        bump_data_generation(es)
+        return
+    alias = create_index(es, index_type)
+    if rebuild:
+        # The new generation is not read until the alias is swapped, so it is always loaded in backfill mode
+        index_name = create_generation(es, alias)
+        print(f"Rebuilding {alias} into {index_name}")
+    else:
+        index_name = alias
+    hashes_dir_path = hashes_dir_path or dir_path
+    hash_store = HashStore(get_store_path(hashes_dir_path, get_concrete_index(es, index_name)))
+    try:
+        with backfill_mode(es, index_name) if backfill or rebuild else nullcontext():
+            failed = load_partitions(es, index_type, start_date, end_date, dir_path, index_name, hash_store,
+                                     resolver_cache_path, resolver_cache_size, max_companies_in_memory,
+                                     manifest_path, force or rebuild, **bulk_options)
+    finally:
+        hash_store.close()
+    if rebuild:
+        if failed:
+            print(f"{failed} documents failed. {alias} still points to the previous index")
+            return
+        swap_alias(es, alias, index_name)
+        prune_generations(es, alias, keep_generations)
+        remove_stale_stores(hashes_dir_path, alias, get_generations(es, alias))
+    # The statistics are computed from the whole index, so an incremental load only computes them when asked to
+    if index_type == "contracts" and company_stats:
+        load_company_stats(es, keep_generations, **bulk_options)
+    bump_data_generation(es)
+
+
+def load_partitions(es: Elasticsearch, index_type: str, start_date: datetime, end_date: datetime, dir_path: str,
+                    index_name: str, hash_store: HashStore, resolver_cache_path=None,
+                    resolver_cache_size=DEFAULT_CACHE_SIZE, max_companies_in_memory=DEFAULT_MAX_COMPANIES,
+                    manifest_path=None, force=False, **bulk_options) -> int:
+    # Returns the number of documents that failed
+    resolver = None
+    aggregator = None
+    if index_type == "companies":
+        aggregator = CompanyAggregator(max_companies=max_companies_in_memory)
+    else:
+        resolver = CompanyResolver(es, COMPANIES_INDEX_NAME, cache_size=resolver_cache_size,
+                                   cache_path=resolver_cache_path)
+        resolver.preload()
+    stage = f"load-{index_name}"
+    manifest = Manifest(manifest_path or os.path.join(dir_path, MANIFEST_FILENAME))
+    aggregated = []
+    unchanged = 0
+    failed = 0
+    for _, file_end_date, filename in get_partitions(dir_path, start_date, end_date, RECORD_EXTENSIONS):
+        partition = get_partition_name(filename)
+        input_hash = hash_files([filename])
+        if resolver is not None:
+            # The contracts are linked to the companies of the index, so they are loaded again if it is rebuilt
+            input_hash = f"{input_hash}:{resolver.index_uuid}"
+        if not force and manifest.is_unchanged(stage, partition, input_hash):
+            unchanged += 1
+            continue
+        data = read_records(filename)
+        if index_type == "companies":
+            print(f"Aggregating companies from {filename}")
+            aggregate_companies(aggregator, data, file_end_date.strftime("%Y-%m-%d"))
+            aggregated.append((partition, input_hash))
+        else:
+            print(f"Loading contracts from {filename}")
+            summary = load_contracts(es, resolver, data, BulkSummary(filename), index_name, hash_store, force,
+                                     **bulk_options)
+            print(summary)
+            failed += summary.failed
+            # A file with awardees that are not linked yet is loaded again by the next run, once their companies may
+            # have been loaded
+            if not summary.failed and not summary.unlinked:
+                manifest.record(stage, partition, input_hash, records=summary.succeeded)
+    print(f"{unchanged} files unchanged since the last load")
+    if aggregator is not None:
+        print("Loading companies")
+        try:
+            summary = load_companies(es, aggregator, BulkSummary(index_name), index_name, hash_store, force,
+                                     **bulk_options)
+            print(summary)
+        finally:
+            aggregator.close()
+        failed += summary.failed
+        if not summary.failed:
+            for partition, input_hash in aggregated:
+                manifest.record(stage, partition, input_hash)
+    if resolver is not None:
+        resolver.save()
+    manifest.close()
+    return failed
+
 
+def create_index(es: Elasticsearch, index_type: str) -> str:
+    # Returns the alias the documents are written to
+    if index_type == "companies":
+        alias = COMPANIES_INDEX_NAME
+    elif index_type == "contracts":
+        alias = CONTRACTS_INDEX_NAME
+    else:
+        raise NotImplementedError()
+    ensure_alias(es, alias)
+    return alias
 
-def load_companies(es: Elasticsearch, data: list):
-    #es.indices.delete(index=COMPANIES_INDEX_NAME)
-    es.indices.create(index=COMPANIES_INDEX_NAME, ignore=400)
+
+def load_batch(es: Elasticsearch, contracts: list, date_str: str, name: str, **bulk_options):
+    # Loads the companies of a batch of contracts and then the contracts. The companies that were upserted are the
+    # ones the contracts are linked to, so they do not need to be resolved.
+    aggregator = CompanyAggregator()
+    aggregate_companies(aggregator, contracts, date_str)
+    companies_summary = load_companies(es, aggregator, BulkSummary(f"{name} (companies)"), **bulk_options)
+    aggregator.close()
+    existing = {get_doc_id(company, fields=['nif']) for contract in contracts for company in contract['adjudicatario']}
+    existing.difference_update(companies_summary.failed_ids)
+    contracts_summary = BulkSummary(f"{name} (contracts)")
+    bulk_load(es, linked_contract_actions(contracts, existing, summary=contracts_summary), contracts_summary,
+              **bulk_options)
+    return companies_summary, contracts_summary
+
+
+def aggregate_companies(aggregator: CompanyAggregator, data, date_str: str):
     for contract in data:
         for company in contract['adjudicatario']:
-            doc = {
-                "nombre": company["name"],
-                "nif": company["nif"],
-                "aliases": company["name"]
-            }
-            doc_id = get_doc_id(doc, fields=['nif'])
-            es.update(
-                index=COMPANIES_INDEX_NAME,
-                doc_type='_doc',
-                body={
-                    "upsert": doc,
-                    "script": {
-                        "source":
-                            """
-                            if(! ctx._source.aliases.contains(params.name)) {
-                                ctx._source.aliases += ", " + params.name
-                            }  
-                            """,
-                        "params": {"name": company["name"]}
-                    }
-                },
-                id=doc_id)
+            aggregator.add(get_doc_id(company, fields=['nif']), company["name"], company["nif"],
+                           contract.get("fecha-formalizacion") or date_str)
+
 
+def load_companies(es: Elasticsearch, aggregator: CompanyAggregator, summary: BulkSummary,
+                   index_name=COMPANIES_INDEX_NAME, hash_store=None, force=False, **bulk_options) -> BulkSummary:
+    if hash_store is not None:
+        return bulk_load_changed(es, company_actions(aggregator, index_name), summary, hash_store, force,
+                                 **bulk_options)
+    return bulk_load(es, company_actions(aggregator, index_name), summary, **bulk_options)
 
-def load_contracts(es: Elasticsearch, data: list):
-    #es.indices.delete(index=CONTRACTS_INDEX_NAME)
-    es.indices.create(index=CONTRACTS_INDEX_NAME, ignore=400, body={
-        "mappings": {
-            "properties": {
-                "adjudicatario": {
-                    "type": "nested",
+
+def company_actions(aggregator: CompanyAggregator, index_name=COMPANIES_INDEX_NAME):
+    for doc_id, doc in aggregator:
+        yield {
+            "_op_type": "update",
+            "_index": index_name,
+            "_id": doc_id,
+            "retry_on_conflict": RETRY_ON_CONFLICT,
+            "upsert": doc,
+            "script": {
+                "source":
+                    """
+                    boolean changed = false;
+                    def aliases = ctx._source.aliases;
+                    if (aliases == null) {
+                        aliases = new ArrayList();
+                    } else if (aliases instanceof String) {
+                        // Aliases were stored as a single comma-separated string
+                        aliases = new ArrayList(Arrays.asList(aliases.splitOnToken(', ')));
+                        changed = true;
+                    }
+                    for (alias in params.aliases) {
+                        if (!aliases.contains(alias)) {
+                            aliases.add(alias);
+                            changed = true;
+                        }
+                    }
+                    ctx._source.aliases = aliases;
+                    if (ctx._source.first_seen == null || ctx._source.first_seen.compareTo(params.first_seen) > 0) {
+                        ctx._source.first_seen = params.first_seen;
+                        changed = true;
+                    }
+                    if (ctx._source.last_seen == null || ctx._source.last_seen.compareTo(params.last_seen) < 0) {
+                        ctx._source.last_seen = params.last_seen;
+                        changed = true;
+                    }
+                    if (!changed) {
+                        ctx.op = 'noop';
+                    }
+                    """,
+                "params": {
+                    "aliases": doc["aliases"],
+                    "first_seen": doc["first_seen"],
+                    "last_seen": doc["last_seen"],
                 }
             }
         }
-    })
-    for contract in data:
+
+
+def load_contracts(es: Elasticsearch, resolver: CompanyResolver, data, summary: BulkSummary,
+                   index_name=CONTRACTS_INDEX_NAME, hash_store=None, force=False, **bulk_options) -> BulkSummary:
+    if hash_store is not None:
+        return bulk_load_changed(es, contract_actions(resolver, data, index_name, summary), summary, hash_store,
+                                 force, **bulk_options)
+    return bulk_load(es, contract_actions(resolver, data, index_name, summary), summary, **bulk_options)
+
+
+def contract_actions(resolver: CompanyResolver, data, index_name=CONTRACTS_INDEX_NAME, summary=None):
+    data = iter(data)
+    for batch in iter(lambda: list(islice(data, RESOLVE_BATCH_SIZE)), []):
+        yield from batch_contract_actions(resolver, batch, index_name, summary)
+
+
+def batch_contract_actions(resolver: CompanyResolver, batch: list, index_name=CONTRACTS_INDEX_NAME, summary=None):
+    existing = resolver.resolve(get_doc_id(company, fields=['nif'])
+                                for contract in batch for company in contract['adjudicatario'])
+    yield from linked_contract_actions(batch, existing, index_name, summary)
+
+
+def linked_contract_actions(contracts: list, existing: set, index_name=CONTRACTS_INDEX_NAME, summary=None):
+    # The awardees that are not linked are counted in the summary, if any
+    for contract in contracts:
         for idx, company in enumerate(contract['adjudicatario']):
             doc_id = get_doc_id(company, fields=['nif'])
-            try:
-                es.get(index=COMPANIES_INDEX_NAME, doc_type="_doc", id=doc_id)
+            if doc_id in existing:
                 contract['adjudicatario'][idx]["id"] = doc_id
-            except NotFoundError:
+            else:
                 print(f"Skipping contract linked to company with NIF {company['nif']}. Company not found")
-        contract_id = get_doc_id(contract, fields=['referencia', 'numero-expediente'])
-        es.update(
-            index=CONTRACTS_INDEX_NAME,
-            doc_type='_doc',
-            body={
-                "doc": contract,
-                "doc_as_upsert": True
-            },
-            id=contract_id)
+                if summary is not None:
+                    summary.unlinked += 1
+        yield {
+            "_op_type": "update",
+            "_index": index_name,
+            "_id": get_doc_id(contract, fields=['referencia', 'numero-expediente']),
+            "retry_on_conflict": RETRY_ON_CONFLICT,
+            "doc": contract,
+            "doc_as_upsert": True
+        }
+
+
+def load_company_stats(es: Elasticsearch, keep_generations=DEFAULT_KEEP_GENERATIONS, **bulk_options) -> bool:
+    # The statistics and the suggestions are computed from all the contracts into new indices, which replace the
+    # previous ones when they are complete
+    print(f"Computing company statistics from {CONTRACTS_INDEX_NAME}")
+    companies = compute_company_stats(scan(es, index=CONTRACTS_INDEX_NAME, size=SCAN_BATCH_SIZE,
+                                           query={"_source": COMPANY_STATS_SOURCE, "query": {"match_all": {}}}))
+    stats_loaded = load_generation(es, COMPANY_STATS_INDEX_NAME, partial(company_stats_actions, companies),
+                                   keep_generations, **bulk_options)
+    suggestions_loaded = load_generation(es, SUGGESTIONS_INDEX_NAME, partial(suggestion_actions, es, companies),
+                                         keep_generations, **bulk_options)
+    return stats_loaded and suggestions_loaded
+
+
+def load_generation(es: Elasticsearch, alias: str, get_actions, keep_generations=DEFAULT_KEEP_GENERATIONS,
+                    **bulk_options) -> bool:
+    # Loads the actions returned by get_actions(index_name) into a new generation of the alias and points the alias
+    # to it if every document has been loaded
+    index_name = create_generation(es, alias)
+    with backfill_mode(es, index_name):
+        summary = bulk_load(es, get_actions(index_name), BulkSummary(index_name), **bulk_options)
+    print(summary)
+    if summary.failed:
+        print(f"{alias} still points to the previous index")
+        return False
+    swap_alias(es, alias, index_name)
+    prune_generations(es, alias, keep_generations)
+    return True
+
+
+def compute_company_stats(hits, top_competitors=DEFAULT_TOP_COMPETITORS) -> dict:
+    # Companies are identified by the id of their document in the companies index, computed from the NIF, so
+    # awardees that could not be linked to a company are counted too
+    companies = {}
+    graph = CompetitorGraph()
+    contract_count = 0
+    for hit in hits:
+        contract = hit["_source"]
+        contract_count += 1
+        date_str = (contract.get("fecha-formalizacion") or "")[0:10] or None
+        # A company that is awarded several lots of a contract counts it once
+        lots = defaultdict(list)
+        for awardee in contract.get("adjudicatario") or []:
+            if awardee.get("nif"):
+                lots[get_doc_id(awardee, fields=['nif'])].append(awardee)
+        for doc_id, awardees in lots.items():
+            if doc_id not in companies:
+                companies[doc_id] = CompanyStats(awardees[0]["nif"])
+            companies[doc_id].add(awardees, date_str, contract.get("organo"))
+            graph.add(doc_id, contract)
+    print(f"{len(companies)} companies in {contract_count} contracts")
+    for doc_id, stats in companies.items():
+        stats.competitors = [{
+            "id": competitor_id,
+            "nombre": companies[competitor_id].name,
+            "nif": companies[competitor_id].nif,
+            "score": round(score, 4),
+            "shared_groups": shared_groups,
+        } for competitor_id, score, shared_groups in graph.get_competitors(doc_id, top_competitors)]
+    return companies
+
+
+def company_stats_actions(companies: dict, index_name: str):
+    for doc_id, stats in companies.items():
+        yield {
+            "_index": index_name,
+            "_id": doc_id,
+            "_source": stats.to_doc(),
+        }
+
+
+def suggestion_actions(es: Elasticsearch, companies: dict, index_name: str):
+    # Companies (by any of their names or their NIF) and organs are ranked by the amount they have been awarded or
+    # have awarded, and contracts by their amount. Contracts are read again from the index, so their titles are not
+    # kept in memory.
+    organos = defaultdict(float)
+    for doc_id, stats in companies.items():
+        for organo, (_, vat_included) in stats.organos.items():
+            organos[organo] += vat_included
+        yield suggestion_action(index_name, "company", doc_id, stats.name, [*sorted(stats.names), stats.nif],
+                                stats.vat_included, nif=stats.nif)
+    for organo, vat_included in organos.items():
+        yield suggestion_action(index_name, "organo", get_doc_id({"organo": organo}, ['organo']), organo, [organo],
+                                vat_included)
+    for hit in scan(es, index=CONTRACTS_INDEX_NAME, size=SCAN_BATCH_SIZE,
+                    query={"_source": SUGGESTION_SOURCE, "query": {"match_all": {}}}):
+        contract = hit["_source"]
+        title = contract.get("titulo") or contract.get("objeto-contrato")
+        if title:
+            yield suggestion_action(index_name, "contract", hit["_id"], title, [title],
+                                    contract.get("importe-con-iva") or 0)
+
+
+def suggestion_action(index_name: str, doc_type: str, doc_id: str, text: str, inputs: list, amount: float, nif=None):
+    return {
+        "_index": index_name,
+        "_id": f"{doc_type}-{doc_id}",
+        "_source": {
+            "suggest": {"input": get_suggestion_inputs(inputs), "weight": get_suggestion_weight(amount)},
+            "type": doc_type,
+            "id": doc_id,
+            "text": text,
+            "nif": nif,
+            "total_vat_included": round(amount, 2),
+        },
+    }
+
+
+def get_suggestion_inputs(texts: list) -> list:
+    # Completion suggestions match the beginning of an input, so the text from every one of its first words is an
+    # input too, and "Pérez" suggests "Construcciones Pérez S.A."
+    inputs = {}
+    for text in texts:
+        # Splitting also drops the separators that completion inputs cannot contain (\x1e, \x1f)
+        words = (text or "").replace("\x00", " ").split()
+        for i in range(min(len(words), MAX_SUGGESTION_WORDS)):
+            inputs[" ".join(words[i:])] = None
+    return list(inputs)
+
+
+def get_suggestion_weight(amount: float) -> int:
+    return int(math.log1p(max(amount, 0)) * SUGGESTION_WEIGHT_SCALE)
 
 
 def get_doc_id(doc: dict, fields):
@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import time
+from hashlib import sha1
+
+# Constants
+MANIFEST_FILENAME = ".etl-manifest.sqlite"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+# Records, per stage and partition, the checksums of the input and the output of the last successful run, so
+# unchanged partitions can be skipped
+class Manifest:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS partitions (
+                stage TEXT NOT NULL,
+                partition TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                output_hash TEXT,
+                records INTEGER,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (stage, partition)
+            )
+        """)
+
+    def get(self, stage: str, partition: str):
+        row = self.connection.execute("SELECT input_hash, output_hash, records, updated_at FROM partitions "
+                                      "WHERE stage = ? AND partition = ?", (stage, partition)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("input_hash", "output_hash", "records", "updated_at"), row))
+
+    def is_unchanged(self, stage: str, partition: str, input_hash: str) -> bool:
+        entry = self.get(stage, partition)
+        return entry is not None and entry["input_hash"] == input_hash
+
+    def record(self, stage: str, partition: str, input_hash: str, output_hash=None, records=None):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?, ?, ?)",
+                                    (stage, partition, input_hash, output_hash, records, time.time()))
+
+    def close(self):
+        self.connection.close()
+
+
+def get_partition_name(path: str) -> str:
+    return os.path.basename(path).split('.')[0]
+
+
+def hash_files(paths) -> str:
+    digest = sha1()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+    return digest.hexdigest()
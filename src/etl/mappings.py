@@ -0,0 +1,175 @@
+from contextlib import contextmanager
+
+from elasticsearch import Elasticsearch
+
+# Constants
+AMOUNT_SCALING_FACTOR = 100
+FORCEMERGE_TIMEOUT = 3600
+BACKFILL_SETTINGS = {
+    "refresh_interval": "-1",
+    "number_of_replicas": 0,
+}
+DATE_FIELD = {"type": "date", "format": "strict_date_optional_time||yyyy-MM-dd"}
+AMOUNT_FIELD = {"type": "scaled_float", "scaling_factor": AMOUNT_SCALING_FACTOR}
+KEYWORD_FIELD = {"type": "keyword"}
+# Searchable text that is also aggregated or matched exactly through the .keyword sub-field
+TEXT_FIELD = {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+# Exact values that are also searched by their words through the .text sub-field
+KEYWORD_TEXT_FIELD = {"type": "keyword", "fields": {"text": {"type": "text"}}}
+
+CONTRACTS_TEMPLATE = {
+    "index_patterns": ["contracts*"],
+    "template": {
+        "mappings": {
+            "properties": {
+                "titulo": {"type": "text"},
+                "objeto-contrato": {"type": "text"},
+                "referencia": KEYWORD_FIELD,
+                "numero-expediente": KEYWORD_FIELD,
+                "cid": KEYWORD_FIELD,
+                "url": {"type": "keyword", "index": False},
+                "actuacion": KEYWORD_FIELD,
+                "estado": KEYWORD_FIELD,
+                "tipo": KEYWORD_FIELD,
+                "tipo-resolucion": KEYWORD_FIELD,
+                "procedimiento": KEYWORD_FIELD,
+                "organo": KEYWORD_TEXT_FIELD,
+                "suborgano": KEYWORD_TEXT_FIELD,
+                "codigo-cpv": KEYWORD_FIELD,
+                "codigo-nuts": KEYWORD_FIELD,
+                "duracion": KEYWORD_FIELD,
+                "compra-innovadora": {"type": "boolean"},
+                "fecha-formalizacion": DATE_FIELD,
+                "fecha-adjudicacion": DATE_FIELD,
+                "fecha-publicacion": DATE_FIELD,
+                "importe-con-iva": AMOUNT_FIELD,
+                "importe-sin-iva": AMOUNT_FIELD,
+                "presupuesto-con-iva": AMOUNT_FIELD,
+                "presupuesto-sin-iva": AMOUNT_FIELD,
+                "adjudicatario": {
+                    "type": "nested",
+                    "properties": {
+                        "id": KEYWORD_FIELD,
+                        "nif": KEYWORD_FIELD,
+                        # The top companies are aggregated by name, so the global ordinals are built on refresh
+                        # instead of on the first query
+                        "name": {
+                            "type": "text",
+                            "fields": {
+                                "keyword": {"type": "keyword", "ignore_above": 256, "eager_global_ordinals": True}
+                            }
+                        },
+                        "lote": KEYWORD_FIELD,
+                        "resultado": KEYWORD_FIELD,
+                        "num-ofertas": {"type": "integer"},
+                        "vat_included": AMOUNT_FIELD,
+                        "vat_excluded": AMOUNT_FIELD,
+                    }
+                }
+            }
+        }
+    }
+}
+
+COMPANIES_TEMPLATE = {
+    "index_patterns": ["companies*"],
+    "template": {
+        "mappings": {
+            "properties": {
+                "nombre": TEXT_FIELD,
+                "nif": KEYWORD_FIELD,
+                "aliases": TEXT_FIELD,
+                "first_seen": DATE_FIELD,
+                "last_seen": DATE_FIELD,
+            }
+        }
+    }
+}
+
+# Statistics of every company, read as a whole by the API. Only the totals are searched and sorted.
+COMPANY_STATS_TEMPLATE = {
+    "index_patterns": ["company_stats*"],
+    "template": {
+        "mappings": {
+            "dynamic": False,
+            "properties": {
+                "nombre": TEXT_FIELD,
+                "nif": KEYWORD_FIELD,
+                "total_vat_included": AMOUNT_FIELD,
+                "total_vat_excluded": AMOUNT_FIELD,
+                "contract_count": {"type": "integer"},
+                "first_date": DATE_FIELD,
+                "last_date": DATE_FIELD,
+                "monthly": {"type": "object", "enabled": False},
+                "top_organos": {"type": "object", "enabled": False},
+                "competitors": {"type": "object", "enabled": False},
+            }
+        }
+    }
+}
+
+# Typeahead suggestions of companies, organs and contracts. The completion field is held in memory as a finite state
+# transducer, so a prefix is looked up without searching the index. Accents and case are ignored.
+SUGGESTIONS_TEMPLATE = {
+    "index_patterns": ["suggestions*"],
+    "template": {
+        "settings": {
+            "analysis": {
+                "analyzer": {
+                    "folding": {
+                        "type": "custom",
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "asciifolding"]
+                    }
+                }
+            }
+        },
+        "mappings": {
+            "dynamic": False,
+            "properties": {
+                "suggest": {
+                    "type": "completion",
+                    "analyzer": "folding",
+                    "contexts": [{"name": "type", "type": "category", "path": "type"}]
+                },
+                "type": KEYWORD_FIELD,
+                "id": KEYWORD_FIELD,
+                "text": {"type": "keyword", "index": False},
+                "nif": KEYWORD_FIELD,
+                "total_vat_included": AMOUNT_FIELD,
+            }
+        }
+    }
+}
+
+INDEX_TEMPLATES = {
+    "contracts": CONTRACTS_TEMPLATE,
+    "companies": COMPANIES_TEMPLATE,
+    "company_stats": COMPANY_STATS_TEMPLATE,
+    "suggestions": SUGGESTIONS_TEMPLATE,
+}
+
+
+def put_index_templates(es: Elasticsearch):
+    # Templates are applied when an index is created, so an index created before them keeps its dynamic mapping
+    # until it is rebuilt
+    for name, template in INDEX_TEMPLATES.items():
+        es.indices.put_index_template(name=name, body=template)
+
+
+@contextmanager
+def backfill_mode(es: Elasticsearch, index_name: str):
+    # Refreshes and replicas are disabled while the index is loaded. The previous settings are restored afterwards
+    # and the index is merged into a single segment.
+    settings = es.indices.get_settings(index=index_name, name=[f"index.{key}" for key in BACKFILL_SETTINGS])
+    previous = {key: None for key in BACKFILL_SETTINGS}
+    for index_settings in settings.values():
+        previous.update(index_settings["settings"]["index"])
+    es.indices.put_settings(index=index_name, body={"index": BACKFILL_SETTINGS})
+    try:
+        yield
+    finally:
+        es.indices.put_settings(index=index_name, body={"index": previous})
+    print(f"Force merging {index_name}")
+    es.indices.refresh(index=index_name)
+    es.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=FORCEMERGE_TIMEOUT)
@@ -0,0 +1,58 @@
+import os
+import re
+from datetime import datetime
+
+# Constants
+DATE_REGEX = r"\d{4}-\d{2}-\d{2}"
+
+
+# Data is partitioned in YYYY/MM/YYYY-MM-DD<extension> files or YYYY/MM/DD/ directories. Only the month directories
+# inside the requested range are listed, so the work done does not depend on the size of the whole tree.
+def iter_months(start_date: datetime, end_date: datetime):
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def get_partitions(root: str, start_date: datetime, end_date: datetime, extensions) -> list:
+    # Returns (start date, end date, path) tuples of the files with data in the range, sorted by date. If a day has
+    # files with several extensions, the most recently modified one is used.
+    regex = re.compile(rf"^({DATE_REGEX})(?:-({DATE_REGEX}))?({'|'.join(re.escape(ext) for ext in extensions)})$")
+    partitions = {}
+    directories = [root] + [os.path.join(root, f"{year:04d}", f"{month:02d}")
+                            for year, month in iter_months(start_date, end_date)]
+    for directory in directories:
+        for entry in _scandir(directory):
+            match = regex.match(entry.name)
+            if not match or not entry.is_file() or (directory == root) != bool(match.group(2)):
+                continue
+            file_start_date = datetime.strptime(match.group(1), "%Y-%m-%d")
+            file_end_date = datetime.strptime(match.group(2), "%Y-%m-%d") if match.group(2) else file_start_date
+            if file_start_date <= end_date and start_date <= file_end_date:
+                key = (file_start_date, file_end_date)
+                if key not in partitions or partitions[key][1] < entry.stat().st_mtime:
+                    partitions[key] = (entry.path, entry.stat().st_mtime)
+    return [(start, end, path) for (start, end), (path, _) in sorted(partitions.items())]
+
+
+def get_day_directories(root: str, start_date: datetime, end_date: datetime) -> list:
+    # Returns (date, path) tuples of the YYYY/MM/DD directories in the range, sorted by date
+    days = []
+    for year, month in iter_months(start_date, end_date):
+        for entry in _scandir(os.path.join(root, f"{year:04d}", f"{month:02d}")):
+            if re.match(r"^\d{2}$", entry.name) and entry.is_dir():
+                try:
+                    date = datetime(year, month, int(entry.name))
+                except ValueError:
+                    continue
+                if start_date <= date <= end_date:
+                    days.append((date, entry.path))
+    return sorted(days)
+
+
+def _scandir(directory: str) -> list:
+    try:
+        return list(os.scandir(directory))
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,221 @@
+import asyncio
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+from elasticsearch import Elasticsearch
+
+from bulk import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_CHUNK_BYTES, DEFAULT_THREAD_COUNT, DEFAULT_MAX_RETRIES
+from extract_csv import fetch_csv, get_csv_path, BASE_URL as CSV_BASE_URL
+from extract_html import Crawler, BASE_URL as HTML_BASE_URL, DEFAULT_RATE_LIMIT
+from fetching import create_session, atomic_write, DEFAULT_CONCURRENCY, DEFAULT_RETRIES
+from indices import bump_data_generation
+from load import create_index, load_batch, load_company_stats
+from transform import transform_csv_content, transform_html_pages
+
+# Constants
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_TRANSFORM_WORKERS = 2
+DEFAULT_LOAD_WORKERS = 1
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_STATS_INTERVAL = 10
+DONE = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CLI to extract, transform and load contracts in a single process')
+    parser.add_argument('format', choices=['csv', 'html'])
+    parser.add_argument('--start-date', type=valid_date, default=datetime(2008, 6, 1),
+                        help="Start date (Format %Y-%m-%d")
+    parser.add_argument('--end-date', type=valid_date, default=datetime.now(), help="End date (Format %Y-%m-%d")
+    parser.add_argument('--raw-dir-path', help="Directory where the downloaded files are kept. Not kept if not set")
+    parser.add_argument('--base-url', help="URL of the CSV export service or of the contracting portal")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of simultaneous requests")
+    parser.add_argument('--rate-limit', type=float, default=DEFAULT_RATE_LIMIT,
+                        help="Minimum number of seconds between the start of two requests (HTML only)")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help="Number of retries of a failed request")
+    parser.add_argument('--download-workers', type=int, default=DEFAULT_DOWNLOAD_WORKERS,
+                        help="Number of days downloaded at the same time")
+    parser.add_argument('--transform-workers', type=int, default=DEFAULT_TRANSFORM_WORKERS,
+                        help="Number of processes transforming days in parallel")
+    parser.add_argument('--load-workers', type=int, default=DEFAULT_LOAD_WORKERS,
+                        help="Number of days loaded at the same time")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Maximum number of days waiting between two stages")
+    parser.add_argument('--stats-interval', type=float, default=DEFAULT_STATS_INTERVAL,
+                        help="Seconds between two reports of the stage statistics")
+    parser.add_argument('--company-stats', action='store_true',
+                        help="Computes the company statistics and suggestions from all the contracts at the end")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Maximum number of documents per bulk request")
+    parser.add_argument('--max-chunk-bytes', type=int, default=DEFAULT_MAX_CHUNK_BYTES,
+                        help="Maximum size in bytes of a bulk request")
+    parser.add_argument('--threads', dest='thread_count', type=int, default=DEFAULT_THREAD_COUNT,
+                        help="Number of threads sending bulk requests in parallel for each load worker")
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help="Number of retries for documents rejected with a 429 status code")
+    run(**vars(parser.parse_args()))
+
+
+def valid_date(s: str) -> datetime:
+    try:
+        return datetime.strptime(s, "%Y-%m-%d")
+    except ValueError:
+        msg = "Not a valid date: '{0}'.".format(s)
+        raise argparse.ArgumentTypeError(msg)
+
+
+# A stage takes (date, payload) items from its input queue and puts the result of processing them in the output
+# queue. Putting waits while the output queue is full, so a slow stage holds back the stages before it instead of
+# piling up data in memory.
+class Stage:
+    def __init__(self, name: str, function, workers: int, input_queue: asyncio.Queue, output_queue=None):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.items = 0
+        self.records = 0
+        self.failed = 0
+        self.busy_time = 0
+        self.blocked_time = 0
+
+    async def run(self, next_workers=0):
+        await asyncio.gather(*(self._work() for _ in range(self.workers)))
+        for _ in range(next_workers):
+            await self.output_queue.put(DONE)
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.input_queue.get()
+            if item is DONE:
+                return
+            date, payload = item
+            start = loop.time()
+            try:
+                result, records = await self.function(date, payload)
+            except Exception as e:
+                self.failed += 1
+                print(f"Stage {self.name} failed for {date.strftime('%Y-%m-%d')}: {e!r}")
+                continue
+            finally:
+                self.busy_time += loop.time() - start
+            self.items += 1
+            self.records += records
+            if self.output_queue is not None and result is not None:
+                start = loop.time()
+                await self.output_queue.put((date, result))
+                self.blocked_time += loop.time() - start
+
+    def report(self, elapsed: float) -> str:
+        # Busy is the share of the time the workers spent processing and blocked the share they spent waiting for
+        # the next stage. The stage with the fullest input queue and busiest workers is the bottleneck.
+        elapsed = max(elapsed, 1e-9)
+        capacity = elapsed * self.workers
+        queue = self.input_queue.qsize()
+        queue_size = f"{queue}/{self.input_queue.maxsize}" if self.input_queue.maxsize else str(queue)
+        return (f"{self.name}: {self.items} days ({self.items / elapsed:.2f}/s), {self.records} records "
+                f"({self.records / elapsed:.1f}/s), {self.failed} failed, input queue {queue_size}, "
+                f"busy {self.busy_time / capacity:.0%}, blocked {self.blocked_time / capacity:.0%}")
+
+
+def run(format: str, start_date: datetime, end_date: datetime, raw_dir_path=None, base_url=None,
+        concurrency=DEFAULT_CONCURRENCY, rate_limit=DEFAULT_RATE_LIMIT, retries=DEFAULT_RETRIES,
+        download_workers=DEFAULT_DOWNLOAD_WORKERS, transform_workers=DEFAULT_TRANSFORM_WORKERS,
+        load_workers=DEFAULT_LOAD_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, stats_interval=DEFAULT_STATS_INTERVAL,
+        company_stats=False, **bulk_options):
+    day_count = (end_date - start_date).days + 1
+    dates = [d for d in (start_date + timedelta(n) for n in range(day_count)) if d <= end_date]
+    asyncio.run(run_pipeline(format, dates, raw_dir_path, base_url, concurrency, rate_limit, retries,
+                             download_workers, transform_workers, load_workers, queue_size, stats_interval,
+                             company_stats, bulk_options))
+
+
+async def run_pipeline(format: str, dates: list, raw_dir_path, base_url, concurrency, rate_limit, retries,
+                       download_workers, transform_workers, load_workers, queue_size, stats_interval,
+                       company_stats, bulk_options):
+    loop = asyncio.get_running_loop()
+    es = Elasticsearch([{'host': 'localhost', 'port': '9200'}])
+    create_index(es, "companies")
+    create_index(es, "contracts")
+    date_queue = asyncio.Queue()
+    for date in dates:
+        date_queue.put_nowait((date, None))
+    for _ in range(download_workers):
+        date_queue.put_nowait(DONE)
+    download_queue = asyncio.Queue(maxsize=queue_size)
+    transform_queue = asyncio.Queue(maxsize=queue_size)
+
+    # Parsing is CPU bound, so it runs in other processes. Loading waits for Elasticsearch, so threads are enough.
+    if transform_workers > 1:
+        transform_executor = ProcessPoolExecutor(max_workers=transform_workers)
+    else:
+        transform_executor = ThreadPoolExecutor(max_workers=1)
+    with transform_executor, ThreadPoolExecutor(max_workers=load_workers) as load_executor:
+        async with create_session(concurrency) as session:
+            if format == "csv":
+                async def download(date: datetime, _):
+                    date_str = date.strftime('%Y-%m-%d')
+                    prev_date_str = (date - timedelta(days=1)).strftime('%Y-%m-%d')
+                    content = await fetch_csv(session, prev_date_str, date_str, base_url or CSV_BASE_URL, retries)
+                    if raw_dir_path:
+                        atomic_write(get_csv_path(raw_dir_path, date), content.encode("utf-8"))
+                    return content, content.count("\n")
+
+                async def transform(date: datetime, content: str):
+                    contracts = await loop.run_in_executor(transform_executor, transform_csv_content, content,
+                                                           date.strftime('%Y-%m-%d'))
+                    return contracts or None, len(contracts)
+            else:
+                crawler = Crawler(session, raw_dir_path or os.curdir, base_url or HTML_BASE_URL, rate_limit, retries)
+
+                async def download(date: datetime, _):
+                    pages = await crawler.fetch_day(date, persist=bool(raw_dir_path))
+                    return pages or None, len(pages)
+
+                async def transform(date: datetime, pages: list):
+                    contracts = await loop.run_in_executor(transform_executor, transform_html_pages, pages)
+                    return contracts, len(contracts)
+
+            async def load(date: datetime, contracts: list):
+                date_str = date.strftime('%Y-%m-%d')
+                summaries = await loop.run_in_executor(load_executor, partial(
+                    load_batch, es, contracts, date_str, date_str, **bulk_options))
+                for summary in summaries:
+                    print(summary)
+                return None, summaries[1].succeeded
+
+            stages = [
+                Stage("download", download, download_workers, date_queue, download_queue),
+                Stage("transform", transform, transform_workers, download_queue, transform_queue),
+                Stage("load", load, load_workers, transform_queue),
+            ]
+            start = loop.time()
+            reporter = asyncio.ensure_future(report_stats(stages, start, stats_interval))
+            try:
+                await asyncio.gather(stages[0].run(transform_workers), stages[1].run(load_workers), stages[2].run())
+                if company_stats:
+                    await loop.run_in_executor(load_executor, partial(load_company_stats, es, **bulk_options))
+            finally:
+                reporter.cancel()
+                bump_data_generation(es)
+    print(f"Finished in {loop.time() - start:.1f} seconds")
+    for stage in stages:
+        print(stage.report(loop.time() - start))
+
+
+async def report_stats(stages: list, start: float, interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        for stage in stages:
+            print(stage.report(loop.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import gzip
+import json
+import os
+import re
+import tempfile
+
+# Constants
+RECORD_EXTENSIONS = ('.ndjson.gz', '.ndjson', '.json')
+DATE_RANGE_REGEX = r"^(\d{4}-\d{2}-\d{2})-(\d{4}-\d{2}-\d{2})$"
+
+
+def get_records_path(output_dir_path: str, date_str: str, compress=False) -> str:
+    extension = '.ndjson.gz' if compress else '.ndjson'
+    if re.match(DATE_RANGE_REGEX, date_str):
+        return os.path.join(output_dir_path, f"{date_str}{extension}")
+    return os.path.join(output_dir_path, date_str[0:4], date_str[5:7], f"{date_str}{extension}")
+
+
+def write_records(records, path: str) -> int:
+    # Records are written one JSON document per line to a temporary file that is renamed when complete
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    os.chmod(tmp_path, 0o644)
+    os.close(fd)
+    count = 0
+    try:
+        with _open(tmp_path, 'wt', compressed=path.endswith('.gz')) as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return count
+
+
+def read_records(path: str):
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+    with _open(path, 'rt', compressed=path.endswith('.gz')) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _open(path: str, mode: str, compressed=False):
+    if compressed:
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
@@ -0,0 +1,118 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan
+
+# Constants
+DEFAULT_CACHE_SIZE = 100000
+MGET_BATCH_SIZE = 1000
+SCAN_BATCH_SIZE = 5000
+DIGEST_DTYPE = 'S20'
+
+
+# Ids known at start-up are kept as a sorted array of raw sha1 digests, which can be persisted to disk and reused by
+# later runs. The persisted ids are only reused while the alias points to the same index and it holds at least as many
+# documents, otherwise they are scanned again. Other ids are looked up with batched mget requests and the answers are
+# kept in a bounded LRU cache.
+class CompanyResolver:
+    def __init__(self, es: Elasticsearch, index_name: str, cache_size=DEFAULT_CACHE_SIZE, cache_path=None):
+        self.es = es
+        self.index_name = index_name
+        self.cache_size = cache_size
+        self.cache_path = cache_path
+        self._known = np.empty(0, dtype=DIGEST_DTYPE)
+        self._cache = OrderedDict()
+        self._found = set()
+        self.index_uuid = None
+
+    def preload(self):
+        self.index_uuid = self._get_index_uuid()
+        if self.cache_path and os.path.exists(self.cache_path) and self._read_cache():
+            print(f"Read known company ids from {self.cache_path}")
+        else:
+            print(f"Scanning known company ids from index {self.index_name}")
+            digests = [_to_digest(hit["_id"]) for hit in scan(self.es, index=self.index_name, _source=False,
+                                                              size=SCAN_BATCH_SIZE, query={"query": {"match_all": {}}})]
+            self._known = np.unique(np.array([digest for digest in digests if digest], dtype=DIGEST_DTYPE))
+        print(f"{len(self._known)} known company ids")
+
+    def save(self):
+        if not self.cache_path:
+            return
+        if self._found:
+            found = np.array([_to_digest(doc_id) for doc_id in self._found], dtype=DIGEST_DTYPE)
+            self._known = np.union1d(self._known, found)
+            self._found = set()
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        with open(self.cache_path, 'wb') as f:
+            np.savez(f, ids=self._known, index_uuid=np.array(self.index_uuid or ""))
+
+    def resolve(self, doc_ids) -> set:
+        doc_ids = list(set(doc_ids))
+        existing = set()
+        missing = []
+        for doc_id, known in zip(doc_ids, self._is_known(doc_ids)):
+            if known:
+                existing.add(doc_id)
+            elif doc_id in self._cache:
+                self._cache.move_to_end(doc_id)
+                if self._cache[doc_id]:
+                    existing.add(doc_id)
+            else:
+                missing.append(doc_id)
+        for start in range(0, len(missing), MGET_BATCH_SIZE):
+            response = self.es.mget(index=self.index_name, body={"ids": missing[start:start + MGET_BATCH_SIZE]},
+                                    _source=False)
+            for doc in response["docs"]:
+                found = doc.get("found", False)
+                self._remember(doc["_id"], found)
+                if found:
+                    existing.add(doc["_id"])
+        return existing
+
+    def _get_index_uuid(self) -> str:
+        # The uuid of the index the alias points to, which changes when the index is rebuilt or created again
+        settings = self.es.indices.get_settings(index=self.index_name, name="index.uuid")
+        return ",".join(sorted(index["settings"]["index"]["uuid"] for index in settings.values()))
+
+    def _read_cache(self) -> bool:
+        try:
+            data = np.load(self.cache_path)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(data, np.lib.npyio.NpzFile):
+            return False
+        with data:
+            if "ids" not in data or "index_uuid" not in data or str(data["index_uuid"]) != self.index_uuid:
+                print(f"The company ids in {self.cache_path} belong to another index")
+                return False
+            known = data["ids"]
+        if len(known) > self.es.count(index=self.index_name)["count"]:
+            print(f"Some company ids in {self.cache_path} have been deleted")
+            return False
+        self._known = known
+        return True
+
+    def _is_known(self, doc_ids) -> np.ndarray:
+        if not len(self._known):
+            return np.zeros(len(doc_ids), dtype=bool)
+        digests = np.array([_to_digest(doc_id) or b'' for doc_id in doc_ids], dtype=DIGEST_DTYPE)
+        positions = np.searchsorted(self._known, digests).clip(max=len(self._known) - 1)
+        return self._known[positions] == digests
+
+    def _remember(self, doc_id: str, found: bool):
+        self._cache[doc_id] = found
+        if found and _to_digest(doc_id):
+            self._found.add(doc_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+def _to_digest(doc_id: str):
+    try:
+        digest = bytes.fromhex(doc_id)
+    except ValueError:
+        return None
+    return digest if len(digest) == 20 else None
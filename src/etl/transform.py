@@ -1,14 +1,53 @@
-from io import StringIO
-import json
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 import os
 import argparse
 from datetime import datetime
 import glob
 import csv
-import locale
-import os
+import heapq
+import io
+import json
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+
+from bs4 import BeautifulSoup, Comment, SoupStrainer
+
+from archive import read_pages, ARCHIVE_EXTENSION
+from manifest import Manifest, get_partition_name, hash_files, MANIFEST_FILENAME
+from partitions import get_day_directories, get_partitions
+from records import get_records_path, write_records
 
-from bs4 import BeautifulSoup, Comment
+csv.register_dialect('custom', delimiter=';')
+
+# Constants
+# Contracts of a CSV file held in memory while their lots are grouped
+MAX_CONTRACTS_IN_MEMORY = 20000
+# Other parsers (e.g. lxml) build a different tree from malformed pages, so the original one is kept
+HTML_PARSER = 'html.parser'
+CONTRACT_STRAINER = SoupStrainer(["h2", "div"], class_=lambda value: value is not None and bool(
+    {"tit11gr3", "listado"}.intersection(value.split() if isinstance(value, str) else value)))
+MONTHS = {month: number for number, month in enumerate(
+    ("enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto", "septiembre", "octubre", "noviembre",
+     "diciembre"), start=1)}
+ATTRIBUTE_MAPPING = {
+    "Estado de la licitación": "estado",
+    "Tipo resolución": "tipo-resolucion",
+    "Resultado": "tipo-resolucion",
+    "Objeto del contrato": "objeto-contrato",
+    "Código CPV": "codigo-cpv",
+    "Tipo Publicación": "actuacion",
+    "Número de expediente": "numero-expediente",
+    "Referencia": "referencia",
+    "Tipo de contrato": "tipo",
+    "Código NUTS": "codigo-nuts",
+    "Procedimiento Adjudicación": "procedimiento",
+    "Valor estimado sin I.V.A": "importe-sin-iva",
+    "Presupuesto base licitación (sin impuestos)": "presupuesto-sin-iva",
+    "Presupuesto base licitación. Importe total": "presupuesto-con-iva",
+    "Duración del contrato": "duracion",
+}
 
 
 def main():
@@ -19,6 +58,11 @@ def main():
     parser.add_argument('--end-date', type=valid_date, default=datetime.now(), help="End date (Format %Y-%m-%d")
     parser.add_argument('--input-dir-path', default=os.path.dirname(__file__))
     parser.add_argument('--output-dir-path', default=os.path.dirname(__file__))
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes transforming files in parallel")
+    parser.add_argument('--compress', action="store_true", help="Writes gzip-compressed files")
+    parser.add_argument('--manifest-path',
+                        help=f"ETL manifest file (Default: {MANIFEST_FILENAME} in --output-dir-path)")
+    parser.add_argument('--force', action="store_true", help="Transforms the files whose input has not changed too")
     transform(**vars(parser.parse_args()))
 
 
@@ -30,178 +74,202 @@ def valid_date(s: str) -> datetime:
         raise argparse.ArgumentTypeError(msg)
 
 
-def transform(format: str, start_date: datetime, end_date: datetime, input_dir_path: str, output_dir_path: str):
+def transform(format: str, start_date: datetime, end_date: datetime, input_dir_path: str, output_dir_path: str,
+              workers=1, compress=False, manifest_path=None, force=False):
     if format == "csv":
-        csv.register_dialect('custom', delimiter=';')
-        for filename in glob.iglob(input_dir_path + '/**/*.csv', recursive=True):
-            date_str = os.path.basename(filename).replace('.csv', '')
-            date = datetime.strptime(date_str, "%Y-%m-%d")
-            if start_date <= date <= end_date:
-                data = transform_csv(filename, date_str)
-                output_path = os.path.join(output_dir_path, date.strftime('%Y'), date.strftime('%m'), f"{date_str}.json")
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                print(f"Transforming data from {filename} to {output_path}")
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=4)
+        # The contracts of a file exported for a range of days (--no-partition) have no formalization date
+        tasks = [(transform_csv_file, [filename],
+                  (filename, file_start_date.strftime("%Y-%m-%d") if file_start_date == file_end_date else None),
+                  get_records_path(output_dir_path, os.path.basename(filename).replace('.csv', ''), compress))
+                 for file_start_date, file_end_date, filename
+                 in get_partitions(input_dir_path, start_date, end_date, ['.csv'])]
     else:
-        previous_date_str = None
-        data = []
-        for filename in sorted(glob.iglob(input_dir_path + '/**/*.html', recursive=True)):
-            date_str = "-".join(filename.split('/')[-4:-1])
-            cid = os.path.basename(filename).replace('.html', '')
-            if previous_date_str is not None and previous_date_str != date_str:
-                # Write to disk
-                if data:
-                    previous_date = datetime.strptime(previous_date_str, "%Y-%m-%d")
-                    output_path = os.path.join(output_dir_path, previous_date.strftime('%Y'),
-                                               previous_date.strftime('%m'),
-                                               f"{previous_date_str}.json")
-                    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                    print(f"Writing data to {output_path}")
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        json.dump(data, f, ensure_ascii=False, indent=4)
-                    data = []
-            previous_date_str = date_str
-            date = datetime.strptime(date_str, "%Y-%m-%d")
-            if start_date <= date <= end_date:
-                contract = transform_html(filename, cid)
-                data.append(contract)
-
-
-def transform_html(filename, cid) -> dict:
-    locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')
-    with open(filename, 'r') as f:
-        contents = f.read()
-        soup = BeautifulSoup(contents, 'html.parser')
-        title = soup.find("h2", {"class", "tit11gr3"})
-        for element in title(text=lambda text: isinstance(text, Comment)):
-            element.extract()
-        contract = {
-            "titulo": title.string
-        }
-        soup.find("h2", {"class", "tit11gr3"})
-        contract_attr_lists = soup.findAll("div", {"class": "listado"})
-        for contract_attr_list in contract_attr_lists:
-            contract_attrs = contract_attr_list.findAll("li", {"class": "txt08gr3"})
-            total_vat_included = 0
-            awardees = []
-            for attr in contract_attrs:
-                for linebreak in attr.find_all('br'):
-                    linebreak.extract()
-                if attr.find("strong") is not None:
-                    attr_name = attr.find("strong").string.replace("\n", "")
-                    attr.find("strong").extract()
-                    attr_value = attr.text.replace("\n", "")
-                    attr_mapping = {
-                        "Estado de la licitación": "estado",
-                        "Tipo resolución": "tipo-resolucion",
-                        "Resultado": "tipo-resolucion",
-                        "Objeto del contrato": "objeto-contrato",
-                        "Código CPV": "codigo-cpv",
-                        "Tipo Publicación": "actuacion",
-                        "Número de expediente": "numero-expediente",
-                        "Referencia": "referencia",
-                        "Tipo de contrato": "tipo",
-                        "Código NUTS": "codigo-nuts",
-                        "Procedimiento Adjudicación": "procedimiento",
-                        "Valor estimado sin I.V.A": "importe-sin-iva",
-                        "Presupuesto base licitación (sin impuestos)": "presupuesto-sin-iva",
-                        "Presupuesto base licitación. Importe total": "presupuesto-con-iva",
-                        "Duración del contrato": "duracion",
-                    }
-                    if attr_name in attr_mapping:
-                        contract[attr_mapping[attr_name]] = attr_value
-                    elif attr_name == "Compra pública innovadora":
-                        contract["compra-innovadora"] = False if attr_value == "No" else True
-                    elif attr_name in ("Formalización del contrato publicada el", "Contrato desierto el",
-                                       "Fecha del contrato",):
-                        contract["fecha-formalizacion"] = parse_contract_date(attr_value)
-                    elif attr_name == "Adjudicación del contrato publicada el":
-                        contract["fecha-adjudicacion"] = parse_contract_date(attr_value)
-                    elif attr_name in (
-                            "Fecha límite de presentación de ofertas o solicitudes de participación",
-                            "Defectos u omisiones de la documentación publicados el",
-                            "Ofertas anormales o desproporcionadas publicadas el"):
-                        pass
-                    elif attr_name in ("Fecha publicación de la licitación en el BOCM",
-                                       "Formalización del contrato publicada en BOCM el",
-                                       "Fecha de publicación",
-                                       "Renuncia del contrato publicada el",
-                                       "Desistimiento del contrato publicado el"):
-                        contract["fecha-publicacion"] = parse_contract_date(attr_value)
-                    elif attr_name == "Entidad adjudicadora":
-                        if "→" in attr_value:
-                            entity = attr_value.split("→")
-                        else:
-                            entity = attr_value.split('··>')
-                        contract['organo'] = " > ".join(entity[0:2]).strip()
-                        contract['suborgano'] = entity[2].strip() if len(entity) > 2 else None
-                    elif attr_name in ("Puntos de Información", "Otros Anuncios", "Modalidad", "Número de ofertas"):
-                        pass
+        tasks = [(transform_html_day, paths, (paths,), get_records_path(output_dir_path, date_str, compress))
+                 for date_str, paths in get_html_days(input_dir_path, start_date, end_date)]
+    stage = f"transform-{format}"
+    manifest = Manifest(manifest_path or os.path.join(output_dir_path, MANIFEST_FILENAME))
+    pending = []
+    for function, input_paths, args, output_path in tasks:
+        partition = get_partition_name(output_path)
+        input_hash = hash_files(input_paths)
+        entry = manifest.get(stage, partition)
+        if (not force and entry is not None and entry["input_hash"] == input_hash
+                and (not entry["records"] or os.path.exists(output_path))):
+            continue
+        pending.append((function, args + (output_path,), output_path, partition, input_hash))
+    print(f"{len(tasks) - len(pending)} partitions unchanged. Transforming {len(pending)} partitions")
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+        map_function = executor.map if executor is not None else map
+        results = map_function(run_task, [task[0] for task in pending], [task[1] for task in pending])
+        for (_, _, output_path, partition, input_hash), records in zip(pending, results):
+            manifest.record(stage, partition, input_hash, hash_files([output_path]) if records else None, records)
+    manifest.close()
+
+
+def run_task(function, args):
+    return function(*args)
+
+
+def transform_csv_file(filename: str, date_str: str, output_path: str) -> int:
+    print(f"Transforming data from {filename} to {output_path}")
+    return write_records(transform_csv(filename, date_str), output_path)
+
+
+def get_html_days(input_dir_path: str, start_date: datetime, end_date: datetime):
+    # Yields the date and the files with the pages of every day: its archive, the pages that were downloaded as
+    # single files before the archives or both
+    days = {}
+    for date, _, path in get_partitions(input_dir_path, start_date, end_date, [ARCHIVE_EXTENSION]):
+        days[date] = [path]
+    for date, path in get_day_directories(input_dir_path, start_date, end_date):
+        days.setdefault(date, []).extend(sorted(glob.glob(os.path.join(path, '*.html'))))
+    for date, paths in sorted(days.items()):
+        yield date.strftime("%Y-%m-%d"), paths
+
+
+def transform_html_day(paths: list, output_path: str) -> int:
+    data = [parse_html(contents, cid) for cid, contents in read_pages(paths)]
+    if not data:
+        return 0
+    print(f"Writing data to {output_path}")
+    return write_records(data, output_path)
+
+
+def transform_html_pages(pages: list) -> list:
+    return [parse_html(contents, cid) for cid, contents in pages]
+
+
+def parse_html(contents: str, cid: str) -> dict:
+    # Only the title and the attribute lists of the page are parsed
+    soup = BeautifulSoup(contents, HTML_PARSER, parse_only=CONTRACT_STRAINER)
+    title = soup.find("h2", {"class", "tit11gr3"})
+    for element in title(text=lambda text: isinstance(text, Comment)):
+        element.extract()
+    contract = {
+        "titulo": title.string
+    }
+    total_vat_included = 0
+    awardees = []
+    for contract_attr_list in soup.find_all("div", {"class": "listado"}):
+        total_vat_included = 0
+        awardees = []
+        for attr in contract_attr_list.find_all("li", {"class": "txt08gr3"}):
+            for linebreak in attr.find_all('br'):
+                linebreak.extract()
+            strong = attr.find("strong")
+            if strong is not None:
+                attr_name = strong.string.replace("\n", "")
+                strong.extract()
+                attr_value = attr.text.replace("\n", "")
+                if attr_name in ATTRIBUTE_MAPPING:
+                    contract[ATTRIBUTE_MAPPING[attr_name]] = attr_value
+                elif attr_name == "Compra pública innovadora":
+                    contract["compra-innovadora"] = False if attr_value == "No" else True
+                elif attr_name in ("Formalización del contrato publicada el", "Contrato desierto el",
+                                   "Fecha del contrato",):
+                    contract["fecha-formalizacion"] = parse_contract_date(attr_value)
+                elif attr_name == "Adjudicación del contrato publicada el":
+                    contract["fecha-adjudicacion"] = parse_contract_date(attr_value)
+                elif attr_name in (
+                        "Fecha límite de presentación de ofertas o solicitudes de participación",
+                        "Defectos u omisiones de la documentación publicados el",
+                        "Ofertas anormales o desproporcionadas publicadas el"):
+                    pass
+                elif attr_name in ("Fecha publicación de la licitación en el BOCM",
+                                   "Formalización del contrato publicada en BOCM el",
+                                   "Fecha de publicación",
+                                   "Renuncia del contrato publicada el",
+                                   "Desistimiento del contrato publicado el"):
+                    contract["fecha-publicacion"] = parse_contract_date(attr_value)
+                elif attr_name == "Entidad adjudicadora":
+                    if "→" in attr_value:
+                        entity = attr_value.split("→")
                     else:
-                        print(f"Attribute skipped: {attr_name} - {attr_value}. CID: {cid}")
-                elif attr.find("table", {"class": "tableAdjudicacion"}) is not None:
-                    table = attr.find("table", {"class": "tableAdjudicacion"})
-                    header = table.find("thead").extract()
-                    rows = table.findAll("tr")
-                    if header.find("th").find("span").string == "RESULTADOS DE LA LICITACIÓN":
-                        for row in rows:
-                            cells = row.findAll("td")
-                            result = cells[2].string
-                            if result not in ("Desierto", "Desistimiento", "Renuncia", "", None):
-                                awardee = {
-                                    "lote": cells[0].string,
-                                    "num-ofertas": int(cells[1].string),
-                                    "resultado": result,
-                                    "nif": cells[3].string,
-                                    "name": cells[4].string,
-                                    "vat_excluded": float(cells[5].string.replace(".", "").replace(",", ".")),
-                                    "vat_included": float(cells[6].string.replace(".", "").replace(",", ".")),
-                                }
-                                total_vat_included += awardee["vat_included"]
-                                awardees.append(awardee)
+                        entity = attr_value.split('··>')
+                    contract['organo'] = " > ".join(entity[0:2]).strip()
+                    contract['suborgano'] = entity[2].strip() if len(entity) > 2 else None
+                elif attr_name in ("Puntos de Información", "Otros Anuncios", "Modalidad", "Número de ofertas"):
+                    pass
                 else:
-                    raise ValueError(f"Attribute not expected: {attr}")
-        contract["url"] = ("http://www.madrid.org/cs/Satellite?"
-                           "c=CM_ConvocaPrestac_FA&"
-                           f"{'idoc' if '-' in cid else 'cid'}={cid}"
-                           "&definicion=Contratos+Publicos"
-                           "&language=es"
-                           "&op2=PCON"
-                           "&pagename=PortalContratacion%2FPage%2FPCON_contratosPublicos"
-                           "&tipoServicio=CM_ConvocaPrestac_FA")
-        # Convert types
-        for key in ("importe-sin-iva", "presupuesto-sin-iva", "presupuesto-con-iva"):
-            contract[key] = (float(contract[key].replace(" euros", "").replace(".", "").replace(",", "."))
-                             if key in contract else None)
-        contract["importe-con-iva"] = total_vat_included
-        contract["adjudicatario"] = awardees
-        contract["cid"] = cid
-        return contract
+                    print(f"Attribute skipped: {attr_name} - {attr_value}. CID: {cid}")
+                continue
+            table = attr.find("table", {"class": "tableAdjudicacion"})
+            if table is None:
+                raise ValueError(f"Attribute not expected: {attr}")
+            header = table.find("thead").extract()
+            if header.find("th").find("span").string == "RESULTADOS DE LA LICITACIÓN":
+                for row in table.find_all("tr"):
+                    cells = row.find_all("td")
+                    result = cells[2].string
+                    if result not in ("Desierto", "Desistimiento", "Renuncia", "", None):
+                        awardee = {
+                            "lote": cells[0].string,
+                            "num-ofertas": int(cells[1].string),
+                            "resultado": result,
+                            "nif": cells[3].string,
+                            "name": cells[4].string,
+                            "vat_excluded": float(cells[5].string.replace(".", "").replace(",", ".")),
+                            "vat_included": float(cells[6].string.replace(".", "").replace(",", ".")),
+                        }
+                        total_vat_included += awardee["vat_included"]
+                        awardees.append(awardee)
+    contract["url"] = ("http://www.madrid.org/cs/Satellite?"
+                       "c=CM_ConvocaPrestac_FA&"
+                       f"{'idoc' if '-' in cid else 'cid'}={cid}"
+                       "&definicion=Contratos+Publicos"
+                       "&language=es"
+                       "&op2=PCON"
+                       "&pagename=PortalContratacion%2FPage%2FPCON_contratosPublicos"
+                       "&tipoServicio=CM_ConvocaPrestac_FA")
+    # Convert types
+    for key in ("importe-sin-iva", "presupuesto-sin-iva", "presupuesto-con-iva"):
+        contract[key] = (float(contract[key].replace(" euros", "").replace(".", "").replace(",", "."))
+                         if key in contract else None)
+    contract["importe-con-iva"] = total_vat_included
+    contract["adjudicatario"] = awardees
+    contract["cid"] = cid
+    return contract
 
 
 def parse_contract_date(date_str) -> str:
     date_list = date_str.strip().split(" ")
-    date_list[1] = date_list[1].capitalize()
-    if len(date_list) == 4:
-        date_list = date_list[0:3]
-    date_str = " ".join(date_list)
-    return datetime.strptime(date_str, '%d %B %Y').strftime("%Y-%m-%d")
+    if len(date_list) not in (3, 4):
+        raise ValueError(f"Not a valid date: '{date_str}'.")
+    try:
+        date = datetime(int(date_list[2]), MONTHS[date_list[1].lower()], int(date_list[0]))
+    except (IndexError, KeyError):
+        raise ValueError(f"Not a valid date: '{date_str}'.")
+    return date.strftime("%Y-%m-%d")
 
 
-def transform_csv(filename, date) -> list:
-    contracts = {}
+def transform_csv(filename, date):
     with open(filename, 'r', encoding="utf-8") as file:
-        content = StringIO(file.read().replace('&#160;', ''))
-    csv_file = csv.DictReader(content, dialect='custom')
+        yield from transform_csv_lines(file, date)
+
+
+def transform_csv_content(content: str, date) -> list:
+    # Lines are split as when the file is read from disk. str.splitlines() would also split on characters such as
+    # \x85, which appear in the text of the rows.
+    return list(transform_csv_lines(io.StringIO(content, newline=None), date))
+
+
+def transform_csv_lines(lines, date, max_contracts=MAX_CONTRACTS_IN_MEMORY):
+    csv_file = csv.DictReader((line.replace('&#160;', '') for line in lines), dialect='custom')
+    if csv_file.fieldnames is not None and 'IMPORTE DE ADJUDICACIÓN(CON IVA)' not in csv_file.fieldnames:
+        print(f"The file corresponding to date {date} has not a valid format. Skipping")
+        return
+    yield from group_contracts(read_csv_contracts(csv_file, date), max_contracts)
+
+
+def read_csv_contracts(csv_file, date):
+    # Rows are read one at a time, and consecutive rows with the same reference (the lots of a contract) are yielded
+    # as a single contract when the reference changes
+    contract = None
     for row in csv_file:
         try:
             importe = float(row['IMPORTE DE ADJUDICACIÓN(CON IVA)'].replace('.', '').replace(',', '.'))
         except ValueError:
             importe = 0
-        except KeyError:
-            print(f"The file corresponding to date {date} has not a valid format. Skipping")
-            return []
         try:
             presupuesto = float(row['PRESUPUESTO DE LICITACIÓN(CON IVA)'].replace('.', '').replace(',', '.'))
         except ValueError:
@@ -213,29 +281,88 @@ def transform_csv(filename, date) -> list:
             "vat_included": importe,
             "nif": row["NIF ADJUDICATARIO"].replace('-', '').replace(' ', '').strip()
         }
-        if (row['REFERENCIA']) not in contracts:
-            entity = row['ENTIDAD ADJUDICADORA'].split('··>')
-            contracts[row['REFERENCIA']] = {
-                'titulo': row['OBJETO DEL CONTRATO'],
-                'referencia': row['REFERENCIA'],
-                'actuacion': row['TIPO DE PUBLICACIÓN'],
-                'tipo': row['TIPO CONTRATO'],
-                'organo': " > ".join(entity[0:2]),
-                'suborgano': entity[2] if len(entity) > 2 else None,
-                'numero-expediente': row['Nº EXPEDIENTE'],
-                'procedimiento': row['PROCEDIMINETO DE ADJUDICACIÓN'],
-                'presupuesto-con-iva': presupuesto,
-                'importe-con-iva': importe,
-                'adjudicatario': [adjudicatario],
-                "fecha-formalizacion": date,
-                'url': (f"http://www.madrid.org/cs/Satellite?"
-                                      f"pagename=PortalContratacion/Comunes/Presentacion/PCON_resultadoBuscadorAvanzado"
-                                      f"&referencia={row['REFERENCIA']}&numeroExpediente={row['Nº EXPEDIENTE']}")
-            }
-        else:
-            contracts[row['REFERENCIA']]['adjudicatario'].append(adjudicatario)
-            contracts[row['REFERENCIA']]['importe-con-iva'] += importe
-    return list(contracts.values())
+        if contract is not None and contract['referencia'] == row['REFERENCIA']:
+            contract['adjudicatario'].append(adjudicatario)
+            contract['importe-con-iva'] += importe
+            continue
+        if contract is not None:
+            yield contract
+        entity = row['ENTIDAD ADJUDICADORA'].split('··>')
+        contract = {
+            'titulo': row['OBJETO DEL CONTRATO'],
+            'referencia': row['REFERENCIA'],
+            'actuacion': row['TIPO DE PUBLICACIÓN'],
+            'tipo': row['TIPO CONTRATO'],
+            'organo': " > ".join(entity[0:2]),
+            'suborgano': entity[2] if len(entity) > 2 else None,
+            'numero-expediente': row['Nº EXPEDIENTE'],
+            'procedimiento': row['PROCEDIMINETO DE ADJUDICACIÓN'],
+            'presupuesto-con-iva': presupuesto,
+            'importe-con-iva': importe,
+            'adjudicatario': [adjudicatario],
+            "fecha-formalizacion": date,
+            'url': (f"http://www.madrid.org/cs/Satellite?"
+                    f"pagename=PortalContratacion/Comunes/Presentacion/PCON_resultadoBuscadorAvanzado"
+                    f"&referencia={row['REFERENCIA']}&numeroExpediente={row['Nº EXPEDIENTE']}")
+        }
+    if contract is not None:
+        yield contract
+
+
+def group_contracts(contracts, max_contracts=MAX_CONTRACTS_IN_MEMORY):
+    # The lots of a contract are not always consecutive, so contracts with the same reference are merged. When more
+    # than max_contracts are held in memory (e.g. in the file of a range of days) they are written, sorted by
+    # reference, to a temporary file, and the files are merged back at the end.
+    grouped = {}
+    spill_files = []
+    try:
+        for contract in contracts:
+            existing = grouped.get(contract['referencia'])
+            if existing is not None:
+                add_lots(existing, contract)
+                continue
+            grouped[contract['referencia']] = contract
+            if len(grouped) >= max_contracts:
+                spill_files.append(spill_contracts(grouped))
+                grouped = {}
+        if not spill_files:
+            yield from grouped.values()
+            return
+        if grouped:
+            spill_files.append(spill_contracts(grouped))
+            grouped = {}
+        runs = [read_spilled_contracts(path) for path in spill_files]
+        for _, entries in groupby(heapq.merge(*runs, key=itemgetter(0)), key=itemgetter(0)):
+            contract = None
+            for _, lots in entries:
+                if contract is None:
+                    contract = lots
+                else:
+                    add_lots(contract, lots)
+            yield contract
+    finally:
+        for path in spill_files:
+            os.remove(path)
+
+
+def add_lots(contract: dict, lots: dict):
+    contract['adjudicatario'] += lots['adjudicatario']
+    contract['importe-con-iva'] += lots['importe-con-iva']
+
+
+def spill_contracts(contracts: dict) -> str:
+    fd, path = tempfile.mkstemp(prefix="contracts-", suffix=".ndjson")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for reference in sorted(contracts):
+            f.write(json.dumps([reference, contracts[reference]], ensure_ascii=False) + "\n")
+    return path
+
+
+def read_spilled_contracts(path: str):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The API is run from src/api, where app is a top-level package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "src", "api"))
@@ -0,0 +1,37 @@
+import asyncio
+
+from elasticsearch.exceptions import NotFoundError
+
+from app.db.batcher import SearchBatcher
+
+
+class Client:
+    def __init__(self):
+        self.requests = []
+
+    async def search(self, index, body):
+        self.requests.append(("search", index))
+        return {"index": index}
+
+    async def msearch(self, body):
+        self.requests.append(("msearch", len(body) // 2))
+        return {"responses": [{"index": header["index"]} if header["index"] != "missing" else
+                              {"error": {"type": "index_not_found_exception"}, "status": 404}
+                              for header in body[0::2]]}
+
+
+def test_batcher_sends_concurrent_searches_together():
+    async def run():
+        client = Client()
+        batcher = SearchBatcher(client)
+        results = await asyncio.gather(batcher.search("companies", {}), batcher.search("contracts", {}),
+                                       batcher.search("missing", {}), return_exceptions=True)
+        assert results[0:2] == [{"index": "companies"}, {"index": "contracts"}]
+        assert isinstance(results[2], NotFoundError)
+        assert await batcher.search("companies", {}) == {"index": "companies"}
+        assert client.requests == [("msearch", 3), ("search", "companies")]
+        # The batches that have been sent are released
+        await asyncio.sleep(0)
+        assert not batcher._sending
+
+    asyncio.run(run())
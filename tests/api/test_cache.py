@@ -0,0 +1,64 @@
+import asyncio
+
+from app.db.cache import ResponseCache
+
+
+class Client:
+    # Meta index without a data generation
+    async def get(self, **kwargs):
+        return {"found": False}
+
+
+def test_cache_coalesces_misses():
+    async def run():
+        cache = ResponseCache(max_entries=10, generation_check_interval=60)
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"hits": 1}
+
+        values = await asyncio.gather(*(cache.get_or_load(Client(), ("key",), 60, load) for _ in range(3)))
+        assert values == [{"hits": 1}] * 3
+        assert await cache.get_or_load(Client(), ("key",), 60, load) == {"hits": 1}
+        assert len(calls) == 1
+        assert (cache.misses, cache.coalesced, cache.hits) == (1, 2, 1)
+
+    asyncio.run(run())
+
+
+def test_cache_cancelled_request_does_not_cancel_waiters():
+    async def run():
+        cache = ResponseCache(max_entries=10, generation_check_interval=60)
+
+        async def load():
+            await asyncio.sleep(0.02)
+            return "value"
+
+        first = asyncio.ensure_future(cache.get_or_load(Client(), ("key",), 60, load))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get_or_load(Client(), ("key",), 60, load))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        assert await second == "value"
+        assert first.cancelled()
+        assert cache.stats()["entries"] == 1
+
+    asyncio.run(run())
+
+
+def test_cache_errors_are_not_cached():
+    async def run():
+        cache = ResponseCache(max_entries=10, generation_check_interval=60)
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("failed")
+
+        results = await asyncio.gather(*(cache.get_or_load(Client(), ("key",), 60, fail) for _ in range(2)),
+                                       return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert await cache.get_or_load(Client(), ("key",), 60, lambda: asyncio.sleep(0, "value")) == "value"
+
+    asyncio.run(run())
@@ -0,0 +1,17 @@
+from app.db.repositories.companies import _get_histogram_buckets
+from app.services.histogram import render_histogram
+
+
+def test_histogram_buckets_fill_empty_months():
+    buckets = _get_histogram_buckets([{"month": "2019-11", "contracts": 2}, {"month": "2020-02", "contracts": 4}])
+    assert [bucket["key_as_string"][0:7] for bucket in buckets] == ["2019-11", "2019-12", "2020-01", "2020-02"]
+    assert [bucket["doc_count"] for bucket in buckets] == [2, 0, 0, 4]
+    assert _get_histogram_buckets([]) == []
+
+
+def test_render_histogram():
+    svg = render_histogram([{"doc_count": 2}, {"doc_count": 0}, {"doc_count": 4}, {"doc_count": 1}])
+    assert svg.startswith('<svg viewBox="0 0 250 200"')
+    assert svg.count("z") == 3
+    assert "M125 200v-200h62.5v200z" in svg
+    assert render_histogram([]) == '<svg viewBox="0 0 250 200" preserveAspectRatio="none"></svg>'
@@ -0,0 +1,53 @@
+import pytest
+
+from app.db.search import (encode_cursor, get_company_contracts_search, get_company_search, get_contract_query,
+                           get_contract_search, InvalidCursor)
+
+
+def get_terms(clauses: list) -> list:
+    # Returns the term of every clause, checking that it is searched in the contract and the awardee fields
+    terms = []
+    for clause in clauses:
+        contract_query, awardee_query = clause["bool"]["should"]
+        assert clause["bool"]["minimum_should_match"] == 1
+        assert awardee_query["nested"]["path"] == "adjudicatario"
+        assert (contract_query["simple_query_string"]["query"] ==
+                awardee_query["nested"]["query"]["simple_query_string"]["query"])
+        terms.append(contract_query["simple_query_string"]["query"])
+    return terms
+
+
+def test_contract_query_terms():
+    text_query = get_contract_query('limpieza  "Ferrovial Servicios" | -obras -"centro de salud"')
+    text_query = text_query["bool"]["must"][0]["bool"]
+    assert get_terms(text_query["must"]) == ["limpieza", '"Ferrovial Servicios"']
+    assert get_terms(text_query["must_not"]) == ["obras", '"centro de salud"']
+
+
+def test_contract_query_without_terms():
+    assert get_contract_query(" | ")["bool"]["must"] == [{"match_all": {}}]
+    assert get_contract_query("", tipos=["Obras"])["bool"]["filter"] == [{"terms": {"tipo": ["Obras"]}}]
+
+
+@pytest.mark.parametrize("values", [
+    ["2020-01-30", "R1"],
+    ["2020-01-30", "R1", "EXP-1", "extra"],
+    [["2020-01-30"], "R1", "EXP-1"],
+    {"fecha": "2020-01-30"},
+])
+def test_company_contracts_search_rejects_invalid_cursor(values):
+    with pytest.raises(InvalidCursor):
+        get_company_contracts_search("id", cursor=encode_cursor(values))
+
+
+def test_company_contracts_search_cursor():
+    assert get_company_contracts_search("id")["track_total_hits"]
+    body = get_company_contracts_search("id", cursor=encode_cursor([1580342400000, "R1", "EXP-1"]))
+    assert body["search_after"] == [1580342400000, "R1", "EXP-1"]
+    assert not body["track_total_hits"]
+    with pytest.raises(InvalidCursor):
+        get_company_contracts_search("id", cursor="not a cursor")
+    with pytest.raises(InvalidCursor):
+        get_contract_search("obras", cursor=encode_cursor([1.5, 1580342400000, "R1"]))
+    with pytest.raises(InvalidCursor):
+        get_company_search("acme", cursor=encode_cursor([1.5]))
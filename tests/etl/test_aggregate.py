@@ -0,0 +1,32 @@
+import os
+
+from aggregate import CompanyAggregator
+
+# Constants
+AWARDINGS = [("c", "C S.A.", "C1", "2020-03-01"), ("a", "ACME", "A1", "2020-02-01"), ("b", "BAR", "B1", "2020-01-01"),
+             ("a", "ACME S.L.", "A1", "2020-01-15"), ("c", "C S.A.", "C1", "2020-04-01"), ("a", "ACME", "A1", "2020-05-01")]
+EXPECTED = [
+    ("a", {"nombre": "ACME S.L.", "nif": "A1", "aliases": ["ACME", "ACME S.L."], "first_seen": "2020-01-15",
+           "last_seen": "2020-05-01"}),
+    ("b", {"nombre": "BAR", "nif": "B1", "aliases": ["BAR"], "first_seen": "2020-01-01", "last_seen": "2020-01-01"}),
+    ("c", {"nombre": "C S.A.", "nif": "C1", "aliases": ["C S.A."], "first_seen": "2020-03-01",
+           "last_seen": "2020-04-01"}),
+]
+
+
+def test_aggregator_in_memory():
+    aggregator = CompanyAggregator()
+    for awarding in AWARDINGS:
+        aggregator.add(*awarding)
+    assert list(aggregator) == EXPECTED
+    assert not aggregator.spill_files
+
+
+def test_aggregator_spills_and_merges(tmp_path):
+    aggregator = CompanyAggregator(max_companies=2, spill_dir=str(tmp_path))
+    for awarding in AWARDINGS:
+        aggregator.add(*awarding)
+    assert len(aggregator.spill_files) > 1
+    assert list(aggregator) == EXPECTED
+    aggregator.close()
+    assert not os.listdir(str(tmp_path))
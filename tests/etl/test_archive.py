@@ -0,0 +1,16 @@
+from archive import append_pages, list_pages, read_archive, update_archive
+
+
+def test_append_pages(tmp_path):
+    path = str(tmp_path / "2020" / "01" / "2020-01-30.html.zip")
+    append_pages(path, {"2": b"<html>2</html>", "1": b"<html>1</html>"})
+    append_pages(path, {"3": b"<html>3</html>", "1": b"<html>other</html>"})
+    assert list(read_archive(path)) == [("2", "<html>2</html>"), ("1", "<html>1</html>"), ("3", "<html>3</html>")]
+
+
+def test_update_archive(tmp_path):
+    path = str(tmp_path / "2020" / "01" / "2020-01-30.html.zip")
+    append_pages(path, {"2": b"<html>2</html>", "1": b"<html>1</html>"})
+    update_archive(path, {"1": b"<html>other</html>", "0": b"<html>0</html>"})
+    assert list_pages(path) == ["0", "1", "2"]
+    assert dict(read_archive(path))["1"] == "<html>other</html>"
@@ -0,0 +1,43 @@
+import bulk
+from bulk import BulkSummary, bulk_load
+
+
+def streaming_bulk(es, actions, **kwargs):
+    # Documents with an id starting with "x" are rejected
+    for action in actions:
+        if action["_id"].startswith("x"):
+            yield False, {"index": {"_id": action["_id"], "status": 400,
+                                    "error": {"type": "mapper_parsing_exception"}}}
+        else:
+            yield True, {"index": {"_id": action["_id"], "result": "noop" if action["_id"] == "a1" else "created"}}
+
+
+def test_bulk_load_summary(monkeypatch):
+    monkeypatch.setattr(bulk, "streaming_bulk", streaming_bulk)
+    actions = [{"_id": doc_id} for doc_id in ("a0", "a1", "x0", "a2", "x1", "a3", "a4")]
+    summary = bulk_load(None, iter(actions), BulkSummary("file"), chunk_size=2, thread_count=2)
+    assert (summary.succeeded, summary.failed) == (5, 2)
+    assert sorted(summary.failed_ids) == ["x0", "x1"]
+    assert str(summary) == ("file: 4 inserted, 0 updated, 1 unchanged, 2 failed. Errors: mapper_parsing_exception (2). "
+                            f"First failed ids: {', '.join(summary.failed_ids)}")
+
+
+def test_bulk_load_consumes_actions_lazily(monkeypatch):
+    # Only a bounded number of chunks is read ahead of the ones that have been sent
+    consumed = []
+    sent = []
+
+    def send(es, actions, **kwargs):
+        sent.extend(actions)
+        assert len(consumed) - len(sent) <= 10 * 2
+        return streaming_bulk(es, actions)
+
+    def actions():
+        for i in range(100):
+            consumed.append(i)
+            yield {"_id": f"a{i}"}
+
+    monkeypatch.setattr(bulk, "streaming_bulk", send)
+    summary = bulk_load(None, actions(), BulkSummary("file"), chunk_size=10, thread_count=1)
+    assert summary.succeeded == 100
+    assert len(sent) == 100
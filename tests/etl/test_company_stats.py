@@ -0,0 +1,29 @@
+from load import compute_company_stats, get_doc_id
+
+
+def get_hit(organo: str, date_str: str, *awardees) -> dict:
+    return {"_source": {
+        "organo": organo,
+        "fecha-formalizacion": date_str,
+        "adjudicatario": [{"nif": nif, "name": name, "vat_included": amount, "vat_excluded": amount}
+                          for nif, name, amount in awardees],
+    }}
+
+
+def test_company_stats_count_contracts_once_per_company():
+    hits = [
+        get_hit("Consejería de Sanidad", "2020-01-10", ("B1", "ACME", 100), ("B1", "ACME", 50), ("B2", "BAR", 10)),
+        get_hit("Consejería de Sanidad", "2020-01-20", ("B1", "ACME S.L.", 25)),
+        get_hit("Consejería de Educación", "2020-02-01", ("B1", "ACME S.L.", 5), ("B1", "ACME S.L.", 5)),
+    ]
+    companies = compute_company_stats(hits)
+    doc = companies[get_doc_id({"nif": "B1"}, fields=['nif'])].to_doc()
+    assert doc["nombre"] == "ACME S.L."
+    assert doc["contract_count"] == 3
+    assert doc["total_vat_included"] == 185
+    assert doc["monthly"] == [{"month": "2020-01", "contracts": 2, "vat_included": 175},
+                              {"month": "2020-02", "contracts": 1, "vat_included": 10}]
+    assert doc["top_organos"] == [{"organo": "Consejería de Sanidad", "contracts": 2, "vat_included": 175},
+                                  {"organo": "Consejería de Educación", "contracts": 1, "vat_included": 10}]
+    assert [competitor["nif"] for competitor in doc["competitors"]] == ["B2"]
+    assert companies[get_doc_id({"nif": "B2"}, fields=['nif'])].to_doc()["contract_count"] == 1
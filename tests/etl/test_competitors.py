@@ -0,0 +1,28 @@
+from competitors import CompetitorGraph
+
+
+def contract(organo=None, tipo=None, cpv=None, date="2020-05-01"):
+    return {"organo": organo, "tipo": tipo, "codigo-cpv": cpv, "fecha-formalizacion": date}
+
+
+def test_smaller_groups_are_stronger_links():
+    graph = CompetitorGraph()
+    for company in ("a", "b"):
+        graph.add(company, contract(organo="Ayuntamiento"))
+    for company in ("a", "c", "d", "e"):
+        graph.add(company, contract(tipo="Obras", cpv="45230000"))
+    competitors = graph.get_competitors("a")
+    assert competitors[0] == ("b", 1.0, 1)
+    assert sorted(company for company, _, _ in competitors[1:]) == ["c", "d", "e"]
+    assert graph.get_competitors("unknown") == []
+
+
+def test_groups_by_year_and_size():
+    graph = CompetitorGraph(max_group_size=2)
+    graph.add("a", contract(organo="Ayuntamiento", date="2019-05-01"))
+    graph.add("b", contract(organo="Ayuntamiento", date="2020-05-01"))
+    for company in ("a", "c", "d"):
+        graph.add(company, contract(organo="Consejería"))
+    graph.add("e", contract(organo="Consejería", date=None))
+    assert graph.get_competitors("a") == []
+    assert "e" not in graph.companies
@@ -0,0 +1,37 @@
+import os
+from datetime import datetime, timedelta
+
+import extract_csv
+
+
+def test_extract_downloads_the_current_day_again(tmp_path, monkeypatch):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    yesterday = today - timedelta(days=1)
+    for date in (yesterday, today):
+        path = extract_csv.get_csv_path(str(tmp_path), date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write("partial")
+    requested = []
+
+    async def download_files(downloads, *args):
+        requested.extend(downloads)
+
+    monkeypatch.setattr(extract_csv, "download_files", download_files)
+    extract_csv.extract(yesterday - timedelta(days=1), today, str(tmp_path))
+    assert [path for _, _, path in requested] == [
+        extract_csv.get_csv_path(str(tmp_path), yesterday - timedelta(days=1)),
+        extract_csv.get_csv_path(str(tmp_path), today),
+    ]
+
+
+def test_extract_skips_closed_range(tmp_path, monkeypatch):
+    requested = []
+
+    async def download_files(downloads, *args):
+        requested.extend(downloads)
+
+    monkeypatch.setattr(extract_csv, "download_files", download_files)
+    open(os.path.join(str(tmp_path), "2019-12-31-2020-01-31.csv"), 'w').close()
+    extract_csv.extract(datetime(2020, 1, 1), datetime(2020, 1, 31), str(tmp_path), no_partition=True)
+    assert requested == []
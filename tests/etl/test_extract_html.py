@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import extract_html
+from archive import get_archive_path, list_pages
+
+
+def get_crawler(dir_path: str, failed=()) -> extract_html.Crawler:
+    # Crawler with a listing of five contracts, whose downloads complete in order
+    crawler = extract_html.Crawler(None, dir_path)
+
+    async def get_contract_urls(date):
+        return [f"{extract_html.BASE_URL}{extract_html.CONTRACT_PREFIX}cid={cid}" for cid in range(5)]
+
+    async def download_html(url):
+        cid = extract_html.get_contract_id(url)
+        await asyncio.sleep(int(cid) * 0.01)
+        if cid in failed:
+            raise IOError(f"Download of {cid} failed")
+        return cid, f"<html>{cid}</html>".encode()
+
+    crawler.get_contract_urls = get_contract_urls
+    crawler.download_html = download_html
+    return crawler
+
+
+def test_crawl_day_completes_closed_days(tmp_path):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    yesterday = today - timedelta(days=1)
+    crawler = get_crawler(str(tmp_path))
+    asyncio.run(crawler.crawl_day(yesterday))
+    asyncio.run(crawler.crawl_day(today))
+    assert crawler.completed == {yesterday.strftime('%Y-%m-%d')}
+    assert extract_html.Crawler(None, str(tmp_path)).completed == crawler.completed
+    assert sorted(list_pages(get_archive_path(str(tmp_path), today))) == ["0", "1", "2", "3", "4"]
+
+
+def test_crawl_day_keeps_pages_of_failed_day(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_html, "ARCHIVE_BATCH_SIZE", 2)
+    date = datetime(2020, 1, 30)
+    crawler = get_crawler(str(tmp_path), failed=("2",))
+    with pytest.raises(IOError):
+        asyncio.run(crawler.crawl_day(date))
+    assert sorted(list_pages(get_archive_path(str(tmp_path), date))) == ["0", "1", "3", "4"]
+    assert crawler.completed == set()
+    # The next crawl only downloads the missing page
+    crawler = get_crawler(str(tmp_path))
+    asyncio.run(crawler.crawl_day(date))
+    assert sorted(list_pages(get_archive_path(str(tmp_path), date))) == ["0", "1", "2", "3", "4"]
+    assert crawler.completed == {"2020-01-30"}
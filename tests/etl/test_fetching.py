@@ -0,0 +1,64 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+import fetching
+from fetching import fetch
+
+
+class FakeResponse:
+    def __init__(self, status: int, body=b""):
+        self.status = status
+        self.body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(None, (), status=self.status)
+
+    async def read(self) -> bytes:
+        return self.body
+
+
+class FakeSession:
+    def __init__(self, responses: list):
+        self.responses = responses
+        self.requests = 0
+
+    def request(self, method: str, url: str, **kwargs):
+        self.requests += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(fetching, "INITIAL_BACKOFF", 0)
+
+
+def test_fetch_retries_transient_errors():
+    session = FakeSession([FakeResponse(503), aiohttp.ClientConnectionError(), FakeResponse(200, b"ok")])
+    assert asyncio.run(fetch(session, "GET", "http://example.com", retries=2)) == b"ok"
+    assert session.requests == 3
+
+
+def test_fetch_gives_up_after_retries():
+    session = FakeSession([FakeResponse(503), FakeResponse(503)])
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(fetch(session, "GET", "http://example.com", retries=1))
+    assert session.requests == 2
+
+
+def test_fetch_does_not_retry_client_errors():
+    session = FakeSession([FakeResponse(404), FakeResponse(200, b"ok")])
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(fetch(session, "GET", "http://example.com", retries=2))
+    assert session.requests == 1
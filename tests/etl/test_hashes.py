@@ -0,0 +1,38 @@
+import bulk
+from bulk import BulkSummary
+from hashes import HashStore, bulk_load_changed, get_content_hash
+
+
+def streaming_bulk(es, actions, **kwargs):
+    # Documents with a name starting with "x" are rejected
+    for action in actions:
+        ok = not action["_source"]["name"].startswith("x")
+        yield ok, {"index": {"_id": action["_id"], "status": 201 if ok else 400, "result": "created",
+                             "error": {"type": "mapper_parsing_exception"}}}
+
+
+def load(store: HashStore, documents: dict, force=False) -> BulkSummary:
+    actions = [{"_index": "companies", "_id": doc_id, "_source": {"name": name}} for doc_id, name in documents.items()]
+    return bulk_load_changed(None, iter(actions), BulkSummary("companies"), store, force=force, thread_count=1)
+
+
+def test_unchanged_documents_are_not_sent(monkeypatch, tmp_path):
+    monkeypatch.setattr(bulk, "streaming_bulk", streaming_bulk)
+    store = HashStore(str(tmp_path / "companies.sqlite"))
+    doc_id = "ab" * 20
+    summary = load(store, {doc_id: "ACME", "other": "x"})
+    assert (summary.succeeded, summary.failed, summary.unchanged) == (1, 1, 0)
+    # The failed document is sent again, and a changed one is sent once more
+    summary = load(store, {doc_id: "ACME", "other": "x"})
+    assert (summary.succeeded, summary.failed, summary.unchanged) == (0, 1, 1)
+    summary = load(store, {doc_id: "ACME S.A.", "other": "BAR"})
+    assert (summary.succeeded, summary.failed, summary.unchanged) == (2, 0, 0)
+    summary = load(store, {doc_id: "ACME S.A.", "other": "BAR"}, force=True)
+    assert (summary.succeeded, summary.unchanged) == (2, 0)
+    store.close()
+
+
+def test_content_hash_ignores_the_index():
+    action = {"_index": "companies-20200101000000", "_id": "a", "_source": {"name": "ACME"}}
+    assert get_content_hash(action) == get_content_hash(dict(action, _index="companies"))
+    assert get_content_hash(action) != get_content_hash(dict(action, _source={"name": "BAR"}))
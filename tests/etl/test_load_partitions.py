@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import load
+from records import get_records_path, write_records
+
+# Constants
+CONTRACT = {"referencia": "R1", "numero-expediente": "EXP-1", "adjudicatario": [{"nif": "B1", "name": "ACME"}]}
+
+
+class CompanyResolver:
+    # Companies index holding the NIFs in companies
+    companies = set()
+    index_uuid = "uuid-1"
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def preload(self):
+        pass
+
+    def resolve(self, doc_ids) -> set:
+        return {doc_id for doc_id in doc_ids
+                if doc_id in {load.get_doc_id({"nif": nif}, fields=['nif']) for nif in self.companies}}
+
+    def save(self):
+        pass
+
+
+def run_load(dir_path: str) -> int:
+    return load.load_partitions(None, "contracts", datetime(2020, 1, 1), datetime(2020, 1, 31), dir_path, "contracts",
+                                None)
+
+
+def test_contracts_are_loaded_again_until_linked(tmp_path, monkeypatch):
+    loaded = []
+
+    def bulk_load(es, actions, summary, **bulk_options):
+        actions = list(actions)
+        loaded.append([[awardee.get("id") for awardee in action["doc"]["adjudicatario"]] for action in actions])
+        summary.succeeded += len(actions)
+        return summary
+
+    monkeypatch.setattr(load, "CompanyResolver", CompanyResolver)
+    monkeypatch.setattr(load, "bulk_load", bulk_load)
+    write_records([dict(CONTRACT)], get_records_path(str(tmp_path), "2020-01-30"))
+    company_id = load.get_doc_id({"nif": "B1"}, fields=['nif'])
+
+    # The company is not loaded yet
+    run_load(str(tmp_path))
+    run_load(str(tmp_path))
+    assert loaded == [[[None]], [[None]]]
+    # The company is loaded, so the contract is linked and not loaded again
+    monkeypatch.setattr(CompanyResolver, "companies", {"B1"})
+    run_load(str(tmp_path))
+    run_load(str(tmp_path))
+    assert loaded[2:] == [[[company_id]]]
+    # The companies index is rebuilt
+    monkeypatch.setattr(CompanyResolver, "index_uuid", "uuid-2")
+    run_load(str(tmp_path))
+    assert loaded[3:] == [[[company_id]]]
@@ -0,0 +1,25 @@
+from manifest import Manifest, get_partition_name, hash_files
+
+
+def test_manifest_records_partitions(tmp_path):
+    path = str(tmp_path / "manifest" / "etl.sqlite")
+    manifest = Manifest(path)
+    assert not manifest.is_unchanged("load", "2020-01-01", "abc")
+    manifest.record("load", "2020-01-01", "abc", records=3)
+    assert manifest.is_unchanged("load", "2020-01-01", "abc")
+    assert not manifest.is_unchanged("load", "2020-01-01", "def")
+    assert not manifest.is_unchanged("transform", "2020-01-01", "abc")
+    manifest.close()
+    manifest = Manifest(path)
+    assert manifest.get("load", "2020-01-01")["records"] == 3
+    manifest.close()
+
+
+def test_hash_files_changes_with_contents(tmp_path):
+    path = tmp_path / "2020-01-01.csv"
+    path.write_text("a;b\n")
+    digest = hash_files([str(path)])
+    assert hash_files([str(path)]) == digest
+    path.write_text("a;c\n")
+    assert hash_files([str(path)]) != digest
+    assert get_partition_name(str(path)) == "2020-01-01"
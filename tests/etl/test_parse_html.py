@@ -0,0 +1,48 @@
+import glob
+import locale
+import os
+
+import pytest
+
+import compare_html
+from transform import parse_html, parse_contract_date
+
+# Constants
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "html")
+PAGES = sorted(glob.glob(os.path.join(FIXTURES_PATH, "*.html")))
+
+
+@pytest.fixture
+def reference(monkeypatch):
+    # The reference parser reads the month names with the es_ES.UTF-8 locale, which is not always installed. The
+    # dates are parsed as parse_html does, and they are compared with the locale in test_parse_contract_date
+    monkeypatch.setattr(compare_html.locale, "setlocale", lambda *args: None)
+    monkeypatch.setattr(compare_html, "parse_contract_date_reference", parse_contract_date)
+    return compare_html.parse_html_reference
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_parse_html(reference, path):
+    with open(path, 'r') as f:
+        contents = f.read()
+    cid = os.path.basename(path).replace(".html", "")
+    assert parse_html(contents, cid) == reference(contents, cid)
+
+
+@pytest.mark.parametrize("date_str, expected", [
+    ("16 marzo 2020", "2020-03-16"),
+    ("2 Marzo 2020 10:15", "2020-03-02"),
+    (" 1 diciembre 2018 ", "2018-12-01"),
+])
+def test_parse_contract_date(date_str, expected):
+    assert parse_contract_date(date_str) == expected
+    try:
+        locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')
+    except locale.Error:
+        return
+    assert compare_html.parse_contract_date_reference(date_str) == expected
+
+
+def test_parse_contract_date_invalid():
+    with pytest.raises(ValueError):
+        parse_contract_date("16 marzo")
@@ -0,0 +1,95 @@
+from hashlib import sha1
+
+import resolver
+from resolver import CompanyResolver
+
+
+def get_id(nif: str) -> str:
+    return sha1(nif.encode()).hexdigest()
+
+
+class Indices:
+    def __init__(self, es):
+        self.es = es
+
+    def get_settings(self, index, name):
+        return {f"{index}-1": {"settings": {"index": {"uuid": self.es.uuid}}}}
+
+
+# Companies index with the given ids, which also answers mget requests
+class Elasticsearch:
+    def __init__(self, ids, uuid="uuid-1"):
+        self.ids = set(ids)
+        self.uuid = uuid
+        self.indices = Indices(self)
+        self.scans = 0
+        self.mgets = []
+
+    def count(self, index):
+        return {"count": len(self.ids)}
+
+    def mget(self, index, body, _source):
+        self.mgets.append(body["ids"])
+        return {"docs": [{"_id": doc_id, "found": doc_id in self.ids} for doc_id in body["ids"]]}
+
+
+def scan(es, **kwargs):
+    es.scans += 1
+    return [{"_id": doc_id} for doc_id in sorted(es.ids)]
+
+
+def test_resolve(monkeypatch):
+    monkeypatch.setattr(resolver, "scan", scan)
+    es = Elasticsearch([get_id("B1"), get_id("B2")])
+    company_resolver = CompanyResolver(es, "companies")
+    company_resolver.preload()
+    es.ids.add(get_id("B3"))
+    assert company_resolver.resolve([get_id("B1"), get_id("B3"), get_id("B4")]) == {get_id("B1"), get_id("B3")}
+    assert company_resolver.resolve([get_id("B3"), get_id("B4")]) == {get_id("B3")}
+    # The answers of the first mget are cached
+    assert [sorted(ids) for ids in es.mgets] == [sorted([get_id("B3"), get_id("B4")])]
+
+
+def test_preload_reuses_cache_of_same_index(monkeypatch, tmp_path):
+    monkeypatch.setattr(resolver, "scan", scan)
+    cache_path = str(tmp_path / "companies.npz")
+    es = Elasticsearch([get_id("B1"), get_id("B2")])
+    company_resolver = CompanyResolver(es, "companies", cache_path=cache_path)
+    company_resolver.preload()
+    es.ids.add(get_id("B3"))
+    company_resolver.resolve([get_id("B3")])
+    company_resolver.save()
+    company_resolver = CompanyResolver(es, "companies", cache_path=cache_path)
+    company_resolver.preload()
+    assert es.scans == 1
+    assert company_resolver.resolve([get_id("B1"), get_id("B3")]) == {get_id("B1"), get_id("B3")}
+    assert len(es.mgets) == 1
+
+
+def test_preload_ignores_cache_of_other_index(monkeypatch, tmp_path):
+    monkeypatch.setattr(resolver, "scan", scan)
+    cache_path = str(tmp_path / "companies.npz")
+    es = Elasticsearch([get_id("B1"), get_id("B2")])
+    company_resolver = CompanyResolver(es, "companies", cache_path=cache_path)
+    company_resolver.preload()
+    company_resolver.save()
+    # The index is rebuilt without B1
+    es = Elasticsearch([get_id("B2")], uuid="uuid-2")
+    company_resolver = CompanyResolver(es, "companies", cache_path=cache_path)
+    company_resolver.preload()
+    assert es.scans == 1
+    assert company_resolver.resolve([get_id("B1"), get_id("B2")]) == {get_id("B2")}
+
+
+def test_preload_ignores_cache_with_deleted_ids(monkeypatch, tmp_path):
+    monkeypatch.setattr(resolver, "scan", scan)
+    cache_path = str(tmp_path / "companies.npz")
+    es = Elasticsearch([get_id("B1"), get_id("B2")])
+    company_resolver = CompanyResolver(es, "companies", cache_path=cache_path)
+    company_resolver.preload()
+    company_resolver.save()
+    es.ids.remove(get_id("B1"))
+    company_resolver = CompanyResolver(es, "companies", cache_path=cache_path)
+    company_resolver.preload()
+    assert es.scans == 2
+    assert company_resolver.resolve([get_id("B1")]) == set()
@@ -0,0 +1,42 @@
+import glob
+import io
+import tempfile
+
+import pytest
+
+from transform import transform_csv_content, transform_csv_lines
+
+# Constants
+HEADER = ("REFERENCIA;OBJETO DEL CONTRATO;TIPO DE PUBLICACIÓN;TIPO CONTRATO;ENTIDAD ADJUDICADORA;Nº EXPEDIENTE;"
+          "PROCEDIMINETO DE ADJUDICACIÓN;PRESUPUESTO DE LICITACIÓN(CON IVA);IMPORTE DE ADJUDICACIÓN(CON IVA);"
+          "ADJUDICATARIO;NIF ADJUDICATARIO")
+
+
+def get_row(reference: str, awardee: str, amount: str) -> str:
+    return (f"{reference};Objeto {reference};Contratos menores;Servicios;Comunidad de Madrid··>Consejería··>Hospital;"
+            f"EXP-{reference};Abierto;1.000,00;{amount};{awardee};B-{awardee}")
+
+
+CONTENT = "\r\n".join([HEADER, get_row("R1", "ACME", "100,00"), get_row("R2", "BAR", "10,00"),
+                       get_row("R1", "BAZ", "200,50"), get_row("R3", "ACME", "1,00"), get_row("R3", "BAR", "2,00")])
+
+
+def get_lots(contracts: list) -> dict:
+    return {contract["referencia"]: ([awardee["name"] for awardee in contract["adjudicatario"]],
+                                     contract["importe-con-iva"]) for contract in contracts}
+
+
+@pytest.mark.parametrize("max_contracts", [1000, 2, 1])
+def test_transform_csv_groups_lots(max_contracts):
+    # Contracts are written to temporary files when more than max_contracts are held in memory
+    contracts = list(transform_csv_lines(io.StringIO(CONTENT, newline=None), "2020-01-30", max_contracts))
+    assert len(contracts) == 3
+    assert get_lots(contracts) == {"R1": (["ACME", "BAZ"], 300.5), "R2": (["BAR"], 10.0), "R3": (["ACME", "BAR"], 3.0)}
+    assert contracts[0]["organo"] == "Comunidad de Madrid > Consejería"
+    assert contracts[0]["adjudicatario"][0]["nif"] == "BACME"
+    assert contracts[0]["fecha-formalizacion"] == "2020-01-30"
+    assert not glob.glob(f"{tempfile.gettempdir()}/contracts-*.ndjson")
+
+
+def test_transform_csv_content_keeps_rows_order():
+    assert [contract["referencia"] for contract in transform_csv_content(CONTENT, None)] == ["R1", "R2", "R3"]